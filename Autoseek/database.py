@@ -0,0 +1,144 @@
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from datetime import datetime
+from functools import wraps
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+from peewee import SqliteDatabase
+from playhouse.pool import PooledSqliteDatabase
+
+from .settings import LOCALDB
+
+
+class DBWriter:
+    '''
+    专用写线程
+
+    peewee连接按线程独立, 写入全部提交到同一线程顺序执行,
+    该线程的连接即唯一的写连接; 批量写入不占用事件循环线程。
+    '''
+
+    def __init__(self, db: SqliteDatabase):
+        self.db = db
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="db-writer")
+        self._thread = None
+
+    def _call(self, func, *args):
+        self._thread = threading.current_thread()
+        return func(*args)
+
+    async def run(self, func, *args):
+        '''在写线程中执行, 异步等待结果'''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call, func, *args)
+
+    def call(self, func, *args):
+        '''在写线程中执行, 阻塞等待结果; 已在写线程中时直接执行'''
+        if threading.current_thread() is self._thread:
+            return func(*args)
+        return self.executor.submit(self._call, func, *args).result()
+
+
+# 写连接
+WRITER = DBWriter(LOCALDB)
+
+# 只读连接池, 供查询及导出使用, 由`init_readers`初始化
+READDB = PooledSqliteDatabase(None)
+
+
+def reads(func):
+    '''
+    只读查询装饰器, 调用期间从连接池取得连接, 返回时归还
+
+    peewee连接按线程保存, 不归还时每个执行过查询的线程各占一个连接,
+    线程数超过连接池上限后查询失败。嵌套调用时由最外层归还。
+    '''
+    @wraps(func)
+    def inner(*args, **kwargs):
+        if not READDB.is_closed():
+            return func(*args, **kwargs)
+        with READDB.connection_context():
+            return func(*args, **kwargs)
+    return inner
+
+
+class DBReader:
+    '''
+    只读查询线程池, 线程数等于连接池上限
+
+    界面的查询均提交到该线程池, 不阻塞事件循环线程。
+    '''
+
+    def __init__(self, workers: int = 4):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="db-reader")
+
+    def resize(self, workers: int):
+        '''按连接池上限重建线程池'''
+        if workers != self.executor._max_workers:
+            self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix="db-reader")
+
+    async def run(self, func, *args):
+        '''在读线程中执行, 异步等待结果'''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+
+# 读线程池
+READER = DBReader()
+
+
+def init_readers(db: SqliteDatabase = LOCALDB, max_connections: int = 4):
+    '''
+    按写库路径初始化只读连接池, 需在数据库迁移完成后调用
+
+    WAL模式下只读连接不会等待写事务。连接归还后可能由其他线程取得,
+    连接池保证同一时刻只有一个线程使用, 关闭sqlite3的同线程检查。
+    '''
+    uri = Path(db.database).resolve().as_uri() + "?mode=ro"
+    READDB.init(
+        uri, uri=True, check_same_thread=False,
+        max_connections=max_connections,
+        stale_timeout=300,
+        pragmas={"query_only": 1}
+    )
+    READER.resize(max_connections)
+
+
+def backup(db: SqliteDatabase, folder: Path, keep: int = 5,
+           pages: int = 256, sleep: float = 0.005) -> Path:
+    '''
+    在线备份数据库并轮换旧备份
+
+    使用sqlite3在线备份API分页复制, 每页之间让出锁;
+    WAL模式下备份期间其他连接仍可读写。
+
+    Args:
+        - `db`: 数据库
+        - `folder`: 备份目录
+        - `keep`: 保留最近的备份份数
+        - `pages`: 每步复制页数
+        - `sleep`: 每步间隔(s)
+
+    Returns:
+        - Path: 备份文件路径
+    '''
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    stem = Path(db.database).stem
+    dest = folder / f"{stem}_{datetime.now():%Y%m%d_%H%M%S_%f}.db"
+    # 独立连接, 不占用应用连接
+    with closing(sqlite3.connect(db.database)) as src, closing(sqlite3.connect(dest)) as target:
+        src.backup(target, pages=pages, sleep=sleep)
+    rotate(folder, stem, keep)
+    return dest
+
+
+def rotate(folder: Path, stem: str, keep: int):
+    '''删除超出保留份数的旧备份'''
+    files = sorted(Path(folder).glob(f"{stem}_*.db"), reverse=True)
+    for f in files[max(keep, 1):]:
+        f.unlink(missing_ok=True)
@@ -8,6 +8,8 @@ class asyncDialog(QDialog, Ui_taskDialog):
     started = pyqtSignal(int, str)
     step = pyqtSignal()
     valueChange = pyqtSignal(int)
+    maximumChange = pyqtSignal(int)
+    textChange = pyqtSignal(str)
     finished = pyqtSignal()
 
     def __init__(self, parent=None) -> None:
@@ -20,6 +22,8 @@ class asyncDialog(QDialog, Ui_taskDialog):
         self.started.connect(self.start_task)
         self.step.connect(self.iter_task)
         self.valueChange.connect(self.progressBar.setValue)
+        self.maximumChange.connect(self.progressBar.setMaximum)
+        self.textChange.connect(self.titleLabel.setText)
         self.finished.connect(self.close)
 
     def start_task(self, num: int, name: str):
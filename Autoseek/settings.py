@@ -7,11 +7,12 @@ from peewee import SqliteDatabase
 # 项目绝对路径
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-# 本地数据库
+# 本地数据库, WAL模式下写入事务不阻塞读取
 LOCALDB = SqliteDatabase(BASE_DIR / "sqlite.db", pragmas={
+    'journal_mode': 'wal',
     'foreign_keys': 1,
     'ignore_check_constraints': 0,
-    'synchronous': 0
+    'synchronous': 1
 })
 
 # 样品数据库
@@ -0,0 +1,372 @@
+import os
+import time
+import random
+import shutil
+import asyncio
+import tempfile
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+from zipfile import ZipFile
+from datetime import datetime
+import xml.etree.ElementTree as ET
+
+from pandas import DataFrame
+from peewee import fn, SqliteDatabase
+from playhouse.migrate import SqliteMigrator, migrate as run_ops
+
+from Autoseek.database import READDB, init_readers
+from .model import QCFile, SDS, SEC, LAL
+from .pptx import A, PPTX, Slide, Table
+from .migrations import MODELS, migrate
+from .search import suggest
+
+
+def benchmark_parse(tables: int = 2000, rows: int = 20, rounds: int = 3):
+    '''旧版DataFrame逐行取值创建实例与按列提取行元组的解析速度对比(行/s)'''
+    def legacy_sds(df: DataFrame) -> list:
+        res = []
+        for i in df.index:
+            sds = SDS(pid=df["蛋白编号"][i], purity=df["纯度(%)"][i])
+            no = int(df.iloc[i, 0]) if df.iloc[i, 0].isdigit() else None
+            if no is not None:
+                sds.non_reduced_lane = no
+                sds.reduced_lane = 8 + no
+            res.append(sds)
+        return res
+
+    def legacy_sec(df: DataFrame) -> list:
+        res = []
+        for i in df.index:
+            sec = SEC(
+                pid=df["蛋白编号"][i],
+                retention_time=df["单体保留时间（min）"][i],
+                hmw=df["高分子聚合物(%)"][i],
+                monomer=df["单体(%)"][i],
+                lmw=df["低分子量物质(%)"][i]
+            )
+            pic_num = df["PDF对应页码"][i]
+            sec.pic_num = int(pic_num) if pic_num.isdigit() else None
+            res.append(sec)
+        return res
+
+    def legacy_lal(df: DataFrame) -> list:
+        res = []
+        for i in df.index:
+            if (not df["蛋白编号"][i]) or (df["蛋白编号"][i].isspace()):
+                continue
+            res.append(LAL(pid=df["蛋白编号"][i], value=df["结果(EU/mg)"][i]))
+        return res
+
+    def make(header: list[str], make_row) -> list[Table]:
+        return [
+            Table.from_rows([header] + [make_row(t, i) for i in range(rows)])
+            for t in range(tables)
+        ]
+
+    frames = {
+        SDS: (legacy_sds, make(
+            ["泳道", "蛋白编号", "纯度(%)"],
+            lambda t, i: [str(i) if i % 4 else "M", f"P{t:04d}{i:02d}", "95"]
+        )),
+        SEC: (legacy_sec, make(
+            ["序号", "蛋白编号", "单体保留时间（min）", "高分子聚合物(%)",
+             "单体(%)", "低分子量物质(%)", "PDF对应页码"],
+            lambda t, i: [str(i), f"P{t:04d}{i:02d}", "9.1", "1.0", "98.0", "1.0", str(i) if i % 4 else ""]
+        )),
+        LAL: (legacy_lal, make(
+            ["序号", "蛋白编号", "结果(EU/mg)"],
+            lambda t, i: [str(i), f"P{t:04d}{i:02d}" if i % 5 else " ", "<0.1"]
+        )),
+    }
+    total = tables * rows * rounds
+    for model, (legacy, items) in frames.items():
+        # 旧版每个表格先构建DataFrame
+        start = time.perf_counter()
+        for _ in range(rounds):
+            before = [legacy(t.to_dataframe()) for t in items]
+        before_cost = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(rounds):
+            after = [model.from_table(t) for t in items]
+        after_cost = time.perf_counter() - start
+        assert [[i.to_row() for i in b] for b in before] == after
+        print(f"{model.__name__}: before {total/before_cost:,.0f} rows/s, "
+              f"after {total/after_cost:,.0f} rows/s")
+
+
+def benchmark_slides(path: str = "tests/sec.pptx", rounds: int = 20):
+    '''单次解析与旧版iterparse+parse两次解析对比'''
+    def two_pass(data: bytes, rel: bytes):
+        ns = dict(i for _, i in ET.iterparse(BytesIO(data), ["start-ns"]))
+        rns = dict(i for _, i in ET.iterparse(BytesIO(rel), ["start-ns"]))
+        bs, rs = ET.parse(BytesIO(data)), ET.parse(BytesIO(rel))
+        tables = []
+        for table_tag in bs.findall(".//a:graphicData", ns):
+            rows = table_tag.findall(".//a:tr", ns)
+            if len(rows) < 2:
+                continue
+            rows = [["".join(c.itertext()) for c in r.findall(".//a:tc", ns)]
+                    for r in rows]
+            tables.append((rows[0], rows[1:]))
+        images = [r.get("Target").replace("..", "ppt")
+                  for r in rs.findall(".//Relationship", rns)
+                  if "media" in r.get("Target")]
+        title = bs.find(".//p:ph[@type='title']/../../..", ns)
+        try:
+            index = int("".join(title.itertext()).strip())
+        except (AttributeError, ValueError):
+            index = None
+        return tables, images, index
+
+    with ZipFile(path) as z:
+        files = [f for f in z.namelist() if f.startswith("ppt/slides/slide")]
+        pairs = [
+            (z.read(f), z.read(f"ppt/slides/_rels/{f.split('/')[-1]}.rels"))
+            for f in files
+        ]
+    for data, rel in pairs:
+        slide = Slide.from_bytes(data, rel)
+        tables = [(list(t.header), [list(r) for r in t.rows]) for t in slide.tables]
+        assert (tables, slide.images, slide.index) == two_pass(data, rel)
+    for name, func in [("two-pass", two_pass), ("single-pass", Slide.from_bytes)]:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for data, rel in pairs:
+                func(data, rel)
+        cost = (time.perf_counter() - start) / rounds
+        print(f"{name}: {cost*1000:.1f} ms/deck, {len(pairs)} slides")
+
+
+def benchmark_ingest(path: str = "tests/sec.pptx", rounds: int = 20):
+    '''
+    旧版逐slide解压与内存读取的整文件解析耗时及写盘量
+
+    两者各在一个空临时目录中运行(旧版解压到当前目录),
+    写盘量为运行后该目录下的文件总大小; 同名文件每轮覆盖, 即每个文件的写盘量。
+    '''
+    path = os.path.abspath(path)
+
+    async def extract():
+        async with PPTX(path) as ppt:
+            for file in ppt.slide_files:
+                ppt._zipfile.extract(file)
+            await ppt.slides()
+
+    async def in_memory():
+        with open(path, "rb") as f:
+            data = f.read()
+        async with PPTX(BytesIO(data)) as ppt:
+            await ppt.slides()
+
+    cwd = os.getcwd()
+    for name, run in [("extract", extract), ("in-memory", in_memory)]:
+        tmp = tempfile.mkdtemp()
+        os.chdir(tmp)
+        try:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                asyncio.run(run())
+            cost = (time.perf_counter() - start) / rounds
+            written = sum(
+                os.path.getsize(os.path.join(root, f))
+                for root, _, files in os.walk(tmp) for f in files
+            )
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmp, ignore_errors=True)
+        print(f"{name}: {cost*1000:.1f} ms/file, {written/1024:.0f} KB/file written")
+
+
+def benchmark_tables(path: str = "tests/sec.pptx", rounds: int = 20):
+    '''
+    由单元格文本构建DataFrame与`Table`的耗时及内存对比
+
+    XML解析在计时外完成, 两者相同; 计时及内存均包含表格对象的构建。
+    '''
+    with ZipFile(path) as z:
+        raw = []
+        for f in z.namelist():
+            if not f.startswith("ppt/slides/slide"):
+                continue
+            root = ET.fromstring(z.read(f))
+            for graphic in root.iter(A + "graphicData"):
+                rows = [
+                    ["".join(col.itertext()) for col in row.iter(A + "tc")]
+                    for row in graphic.iter(A + "tr")
+                ]
+                if len(rows) >= 2:
+                    raw.append(rows)
+    builders = [
+        ("DataFrame", lambda rows: DataFrame(rows[1:], columns=rows[0])),
+        ("Table", Table.from_rows),
+    ]
+    for name, build in builders:
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for rows in raw:
+                build(rows)
+        cost = (time.perf_counter() - start) / rounds
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # 单独统计保留一份全部表格的内存
+        tracemalloc.start()
+        kept = [build(rows) for rows in raw]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del kept
+        print(f"{name}: {cost*1000:.2f} ms/deck, {size/1024:.0f} KB kept, "
+              f"{peak/1024:.0f} KB peak, {len(raw)} tables")
+
+
+def benchmark_migrate(files: int = 5000, rows: int = 20, searches: int = 500, ingest: int = 100):
+    '''
+    旧版无索引库与迁移后库的查询、入库耗时对比
+
+    每个模型约`files * rows`行, 默认各10万行; 数据库为临时文件。
+    '''
+    tmp = tempfile.mkdtemp()
+    db = SqliteDatabase(os.path.join(tmp, "bench.db"), pragmas={"foreign_keys": 1, "synchronous": 0})
+    rnd = random.Random(0)
+    now = datetime.now()
+
+    def make_rows(model, src: int, pid: int) -> list[tuple]:
+        # 同一文件中pid连续, 少量重复行用于验证迁移去重
+        res = []
+        for i in range(rows):
+            p = f"P{pid + i:06d}"
+            if model is SDS:
+                res.append((p, "95%", f"ppt/media/image{i}.png", i, 8 + i, src))
+            elif model is SEC:
+                res.append((p, "9.1", "1.0", "98.0", "1.0", i, src))
+            else:
+                res.append((p, "<0.1", src))
+        return res + res[:1]
+
+    def fill(model, sources: range):
+        fields = [getattr(model, f) for f in model.ROW_FIELDS] + [model.source]
+        for src in sources:
+            model.insert_many(make_rows(model, src, src * rows), fields=fields).execute()
+
+    def run(label: str, legacy: bool):
+        pids = [f"P{rnd.randrange(files * rows):06d}" for _ in range(searches)]
+        start = time.perf_counter()
+        for pid in pids:
+            for model in (SDS, SEC, LAL):
+                list(model.select().where(model.pid == pid))
+        search = (time.perf_counter() - start) / searches
+        names = [f"SEC {rnd.randrange(files)}.pdf" for _ in range(searches // 10)]
+        start = time.perf_counter()
+        for name in names:
+            if legacy:
+                list(SEC.select().join(QCFile, on=(SEC.source == QCFile.id))
+                     .where(QCFile.name.contains(name[:-4])))
+            else:
+                SEC.add_attach(QCFile(name=name))
+        attach = (time.perf_counter() - start) / len(names)
+        base = QCFile.select(fn.MAX(QCFile.id)).scalar()
+        start = time.perf_counter()
+        with db.atomic():
+            for i in range(base + 1, base + ingest + 1):
+                data = {"name": f"SEC {i}.pptx", "path": tmp, "modified": now}
+                if not legacy:
+                    data["stem"] = QCFile.make_stem(data["name"])
+                src = QCFile(id=QCFile.insert(**data).execute(), **data)
+                items = [r[:-1] for r in make_rows(SEC, i, i * rows)]
+                SEC.insert_ignore([(r, src.id) for r in SEC.dedupe(src, items)])
+        cost = (time.perf_counter() - start) / ingest
+        print(f"{label}: search {search*1000:.2f} ms/pid, attach {attach*1000:.2f} ms/pdf, "
+              f"ingest {cost*1000:.2f} ms/file, {SEC.select().count()} SEC rows")
+
+    with db.bind_ctx(MODELS):
+        # 构造旧版库: 无自然键索引及stem列
+        db.create_tables(MODELS)
+        for model in (SDS, SEC, LAL, QCFile):
+            for index in db.get_indexes(model._meta.table_name):
+                if "pid" in index.columns or index.columns == ["stem"]:
+                    db.execute_sql(f'DROP INDEX "{index.name}"')
+        run_ops(SqliteMigrator(db).drop_column(QCFile._meta.table_name, "stem"))
+        db.user_version = 1
+        QCFile.insert_many(
+            [(f"SEC {i}.pptx", tmp, now) for i in range(1, files + 1)],
+            fields=[QCFile.name, QCFile.path, QCFile.modified]
+        ).execute()
+        for model in (SDS, SEC, LAL):
+            fill(model, range(1, files + 1))
+        run("before", legacy=True)
+        start = time.perf_counter()
+        migrate(db, Path(tmp) / "backup")
+        print(f"migrate: {time.perf_counter() - start:.2f} s")
+        run("after", legacy=False)
+    db.close()
+
+
+def benchmark_suggest(rows: int = 500000, rounds: int = 50):
+    '''
+    临时库中`rows`条结果的联想查询耗时
+
+    期间只读连接池指向临时库, 结束后恢复; 原先未初始化时恢复为未初始化。
+    '''
+    previous = READDB.database
+    tmp = tempfile.mkdtemp()
+    db = SqliteDatabase(os.path.join(tmp, "bench.db"), pragmas={"journal_mode": "wal", "synchronous": 0})
+    files = rows // 50
+    with db.bind_ctx(MODELS):
+        migrate(db)
+        QCFile.insert_many(
+            [(f"【SEC】{i}.pptx", tmp, datetime.now()) for i in range(1, files + 1)],
+            fields=[QCFile.name, QCFile.path, QCFile.modified]
+        ).execute()
+        start = time.perf_counter()
+        with db.atomic():
+            for i in range(0, rows, 1000):
+                SEC.insert_many(
+                    [
+                        (f"P{j:05d}" + ("-2" if j % 7 == 0 else ""), "9.1", "1.0", "98.0", "1.0", j // 50 + 1)
+                        for j in range(i, min(i + 1000, rows))
+                    ],
+                    fields=[SEC.pid, SEC.retention_time, SEC.hmw, SEC.monomer, SEC.lmw, SEC.source]
+                ).execute()
+        print(f"ingest with index: {(time.perf_counter() - start):.1f} s, {rows} rows")
+        init_readers(db)
+        try:
+            _suggest_cases(rows, rounds)
+        finally:
+            READDB.close_all()
+            if previous is None:
+                READDB.init(None)
+            else:
+                init_readers()
+    db.close()
+
+
+def _suggest_cases(rows: int, rounds: int):
+    '''联想查询各类输入的耗时'''
+    rnd = random.Random(0)
+    cases = {
+        "prefix": lambda: f"P{rnd.randrange(rows // 100):03d}",
+        "lowercase": lambda: f"p{rnd.randrange(rows):05d}",
+        "suffix": lambda: f"P{rnd.randrange(rows // 7) * 7:05d}-2",
+        "fuzzy": lambda: (lambda p: p[:3] + "x" + p[4:])(f"P{rnd.randrange(rows):05d}"),
+        "range": lambda: (lambda n: f"P{n:05d}-P{n + 500:05d}")(rnd.randrange(rows - 500)),
+        # 宽泛输入: 命中全部文件名或大量pid
+        "broad name": lambda: "SEC",
+        "broad pid": lambda: f"P{rnd.randrange(10)}{rnd.randrange(10)}",
+        "broad infix": lambda: f"{rnd.randrange(100):02d}0",
+    }
+    for name, make in cases.items():
+        start = time.perf_counter()
+        for _ in range(rounds):
+            res = suggest(make())
+        cost = (time.perf_counter() - start) / rounds
+        print(f"{name}: {cost*1000:.1f} ms, e.g. {res[:3]}")
+
+
+if __name__ == "__main__":
+    benchmark_parse()
+    benchmark_slides()
+    benchmark_ingest()
+    benchmark_tables()
+    benchmark_migrate()
+    benchmark_suggest()
@@ -12,7 +12,7 @@ from .model import *
 
 
 class SdsRadioButton(QRadioButton):
-    def __init__(self, parent=None, sds: SDS = None):
+    def __init__(self, parent=None, sds: SDSResult = None):
         self._sds = sds
         mtime = sds.source.modified.date()
         super().__init__(f"{sds.purity}({mtime})", parent)
@@ -23,7 +23,7 @@ class SdsRadioButton(QRadioButton):
 
 
 class SecRadioButton(QRadioButton):
-    def __init__(self, parent=None, sec: SEC = None):
+    def __init__(self, parent=None, sec: SECResult = None):
         self._sec = sec
         mtime = sec.source.modified.date()
         super().__init__(f"{sec.monomer}({mtime})", parent)
@@ -34,7 +34,7 @@ class SecRadioButton(QRadioButton):
 
 
 class LalRadioButton(QRadioButton):
-    def __init__(self, parent=None, lal: LAL = None):
+    def __init__(self, parent=None, lal: LALResult = None):
         self._lal = lal
         mtime = lal.source.modified.date()
         super().__init__(f"{lal.value}({mtime})", parent)
@@ -81,19 +81,19 @@ class QcresultDialog(QDialog, Ui_QcresultDialog):
         # 信号-槽连接
         self.okButton.clicked.connect(self.accept)
 
-    def add_sds(self, sds: SDS):
+    def add_sds(self, sds: SDSResult):
         radio_btn = SdsRadioButton(self, sds)
         radio_btn.setChecked(True)
         self.verticalLayout_2.addWidget(radio_btn)
         self.sdsGroup.addButton(radio_btn)
 
-    def add_sec(self, sec: SEC):
+    def add_sec(self, sec: SECResult):
         radio_btn = SecRadioButton(self, sec)
         radio_btn.setChecked(True)
         self.verticalLayout_3.addWidget(radio_btn)
         self.secGroup.addButton(radio_btn)
 
-    def add_lal(self, lal: LAL):
+    def add_lal(self, lal: LALResult):
         radio_btn = LalRadioButton(self, lal)
         radio_btn.setChecked(True)
         self.verticalLayout_4.addWidget(radio_btn)
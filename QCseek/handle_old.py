@@ -6,6 +6,7 @@ import pandas as pd
 from tqdm.asyncio import tqdm_asyncio
 
 from .model import *
+from .scanner import FileRecord
 from .view import CreateError, create_ssl, attach_pdf
 
 
@@ -64,7 +65,7 @@ def collect_files():
 async def update_ssl(datafile: str, model: BaseModel):
     '''从EXCEL表批量创建SDS/SEC/LAL'''
     df = pd.read_excel(datafile)
-    tasks = [asyncio.create_task(create_ssl(path, name, model))
+    tasks = [asyncio.create_task(create_ssl(FileRecord.from_path(path, name), model))
              for path, name in df.itertuples(index=False)
              if name.lower().endswith("pptx")]
     res = await asyncio.gather(*tasks, return_exceptions=True)
@@ -82,7 +83,7 @@ async def update_ssl(datafile: str, model: BaseModel):
             updating += r
     # 更新数据库
     with db.atomic():
-        model.bulk_create(updating, batch_size=100)
+        model.insert_ignore(updating)
         for i in failed:
             i.delete_instance()
     # 输出错误文件
@@ -100,7 +101,8 @@ async def update_pdf(datafile: str):
     tasks = []
     for path, name in df.itertuples(index=False):
         if name.lower().endswith("pdf"):
-            tasks.append(asyncio.create_task(attach_pdf(path, name)))
+            file = FileRecord.from_path(path, name)
+            tasks.append(asyncio.create_task(attach_pdf(file)))
     res = await asyncio.gather(*tasks, return_exceptions=True)
     updating, failed, errors = [], [], []
     for r in res:
@@ -0,0 +1,208 @@
+import os
+import time
+import asyncio
+import hashlib
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+
+from Autoseek.settings import CONFIG, LOCALDB
+from Autoseek.database import WRITER
+from .model import QCFile, BaseModel, SDS, SEC, LAL, ParseCache, IngestError
+from .pptx import PPTX
+
+
+MODELS = {"SDS": SDS, "SEC": SEC, "LAL": LAL}
+
+
+class CreateError(Exception):
+    '''模型创建异常'''
+
+    def __init__(self, qcfile: QCFile | None, path: str, name: str, msg: str):
+        super().__init__(msg)
+        self.qcfile = qcfile
+        self.path = path
+        self.name = name
+
+
+def read_file(path: str) -> tuple[bytes, str]:
+    '''
+    顺序读取整个文件并计算摘要, 避免ZipFile在网络路径上随机读取
+
+    一次读取按文件大小预分配, 内存中只有一份文件内容。
+
+    Returns:
+        - bytes: 文件内容
+        - str: 摘要, `大小-blake2b`
+    '''
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, f"{len(data)}-{hashlib.blake2b(data, digest_size=16).hexdigest()}"
+
+
+async def parse_pptx(data: bytes, model) -> tuple[list[tuple], list[tuple]]:
+    '''
+    容错解析PPTX字节, 不访问数据库
+
+    单个表格失败时跳过该表格; 文件损坏等整体失败时无结果, 错误slide为None。
+
+    Returns:
+        - list[tuple]: 行元组列表
+        - list[tuple]: 错误列表, `(slide序号, 原因)`
+    '''
+    errors = []
+    try:
+        async with PPTX(BytesIO(data)) as ppt:
+            rows = await model.from_pptx(ppt, errors)
+    except Exception as e:
+        return [], [(None, f"{type(e).__name__}({e})")]
+    return rows, errors
+
+
+def parse_rows(data: bytes, model_name: str) -> tuple[list[tuple], list[tuple]]:
+    '''
+    进程池worker: 解析PPTX字节
+
+    Args:
+        - `data`: 文件内容
+        - `model_name`: 模型名称, SDS/SEC/LAL
+
+    Returns:
+        - list[tuple]: 行元组列表, 字段见`ROW_FIELDS`
+        - list[tuple]: 错误列表, `(slide序号, 原因)`
+    '''
+    return asyncio.run(parse_pptx(data, MODELS[model_name]))
+
+
+def remember(digest: str, model, rows: list[tuple], errors: list[tuple]):
+    '''按内容摘要缓存解析结果及错误, 无结果的文件同样缓存, 内容不变时不再解析'''
+    with LOCALDB.atomic():
+        ParseCache.store(digest, model, rows)
+        IngestError.store(digest, model, errors)
+
+
+def error_dict(qcfile: QCFile, slide: int | None, reason: str) -> dict:
+    '''错误报告行'''
+    error = reason if slide is None else f"slide{slide}: {reason}"
+    return {"path": qcfile.path, "name": qcfile.name, "error": error}
+
+
+class IngestScheduler:
+    '''
+    分阶段限流的解析调度器
+
+    读取、解析、写库三个阶段分别限制并发; 文件在取得解析槽位后才读取,
+    内存中的文件字节最多为`parse`份。在途任务数达到上限时`submit`阻塞,
+    扫描结果暂停消费; 目录列举线程仍继续, 排队的只是文件记录。
+    内容摘要命中`ParseCache`时跳过解析。
+    解析为容错模式, 失败的表格记入`IngestError`, 其余表格照常入库;
+    只有读取失败的文件不入库, 下次扫描重试。
+    `processes`大于0时解析在进程池中完成, 绕开GIL, 主进程只写库。
+    '''
+
+    def __init__(self, dialog, title: str, read: int = 4, parse: int = 4,
+                 write: int = 1, pending: int = 32, processes: int = 0):
+        self.dialog = dialog
+        self.title = title
+        self.pool = ProcessPoolExecutor(processes) if processes > 0 else None
+        self._read = asyncio.Semaphore(read)
+        self._parse = asyncio.Semaphore(max(parse, processes))
+        self._write = asyncio.Semaphore(write)
+        self._pending = asyncio.Semaphore(pending)
+        self.tasks: list[tuple[type[BaseModel], asyncio.Task]] = []
+        self.files = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+
+    @classmethod
+    def from_config(cls, dialog, title: str):
+        '''读取`[QCSEEK]`中的并发配置'''
+        qcconfig = CONFIG["QCSEEK"]
+        processes = 0
+        if qcconfig.get("ParseBackend", "thread") == "process":
+            processes = qcconfig.getint("ProcessWorkers", 0) or os.cpu_count()
+        return cls(
+            dialog, title,
+            read=qcconfig.getint("ReadWorkers", 4),
+            parse=qcconfig.getint("ParseWorkers", 4),
+            write=qcconfig.getint("WriteWorkers", 1),
+            pending=qcconfig.getint("IngestQueue", 32),
+            processes=processes,
+        )
+
+    @property
+    def throughput(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        return f"{self.files/elapsed:.1f}个/s, {self.bytes/elapsed/2**20:.1f}MB/s"
+
+    async def submit(self, qcfile: QCFile, model):
+        '''提交解析任务, 在途任务已满时等待'''
+        await self._pending.acquire()
+        task = asyncio.create_task(self._run(qcfile, model))
+        task.add_done_callback(self._done)
+        self.tasks.append((model, task))
+
+    def _done(self, task: asyncio.Task):
+        self._pending.release()
+        self.files += 1
+        self.dialog.step.emit()
+        self.dialog.textChange.emit(f"{self.title} {self.throughput}")
+
+    async def _parse_rows(self, data: bytes, model) -> tuple[list[tuple], list[tuple]]:
+        if self.pool is None:
+            return await parse_pptx(data, model)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, parse_rows, data, model.__name__)
+
+    async def _run(self, qcfile: QCFile, model) -> tuple[tuple[QCFile, list[tuple]], list[dict]]:
+        try:
+            # 先取得解析槽位再读取, 等待解析的文件不占内存
+            async with self._parse:
+                async with self._read:
+                    data, digest = await asyncio.to_thread(read_file, qcfile.shortpathname)
+                self.bytes += len(data)
+                rows = ParseCache.lookup(digest, model)
+                cached = rows is not None
+                if cached:
+                    errors = IngestError.lookup(digest, model)
+                else:
+                    rows, errors = await self._parse_rows(data, model)
+                del data
+            async with self._write:
+                if not cached:
+                    await WRITER.run(remember, digest, model, rows, errors)
+                rows = model.dedupe(qcfile, rows)
+            return (qcfile, rows), [error_dict(qcfile, *e) for e in errors]
+        except Exception as e:
+            raise CreateError(qcfile, qcfile.path, qcfile.name, str(e))
+
+    def close(self):
+        '''关闭进程池'''
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def join(self) -> dict:
+        '''
+        等待全部任务完成
+
+        Returns:
+            - dict: `{model: ((来源文件, 待保存行元组)列表, 失败文件, 错误字典)}`
+        '''
+        res = await asyncio.gather(*[t for _, t in self.tasks], return_exceptions=True)
+        results = {}
+        for (model, _), r in zip(self.tasks, res):
+            updating, failed, errors = results.setdefault(model, ([], [], []))
+            if isinstance(r, CreateError):
+                errors.append({
+                    "path": r.path,
+                    "name": r.name,
+                    "error": str(r)
+                })
+                if r.qcfile is not None:
+                    failed.append(r.qcfile)
+            elif isinstance(r, BaseException):
+                raise r
+            else:
+                item, errs = r
+                updating.append(item)
+                errors += errs
+        return results
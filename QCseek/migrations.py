@@ -0,0 +1,144 @@
+from pathlib import Path
+
+from peewee import fn, Select
+from playhouse.migrate import SqliteMigrator, migrate as run_ops
+
+from Autoseek.settings import BASE_DIR, CONFIG, LOCALDB
+from Autoseek.database import backup
+from .model import (
+    QCFile, SDS, SEC, LAL, Tombstone, ParseCache, ScanDir, PidSearch, IngestError
+)
+
+
+MODELS = [QCFile, SDS, SEC, LAL, Tombstone, ParseCache, ScanDir, PidSearch, IngestError]
+
+
+def v1_baseline(db):
+    '''基线: 旧版启动时`create_tables`创建的表, 补建后续新增的辅助表'''
+    db.create_tables([Tombstone, ParseCache, ScanDir])
+
+
+def v2_natural_keys(db):
+    '''
+    删除重复数据后建立自然键唯一索引, 新增`QCFile.stem`列并回填
+
+    每组优先保留已添加附件、有图片页码的行, 其次id最小的行。
+    '''
+    for model in (SDS, SEC, LAL):
+        fields = [getattr(model, f) for f in model.DEDUPE_FIELDS] + [model.source]
+        order = [model.id]
+        if model is SEC:
+            order = [SEC.attach.is_null(), SEC.pic_num.is_null(), SEC.id]
+        ranked = model.select(
+            model.id,
+            fn.ROW_NUMBER().over(partition_by=fields, order_by=order).alias("rank")
+        ).alias("ranked")
+        keep = Select([ranked], [ranked.c.id]).where(ranked.c.rank == 1)
+        model.delete().where(model.id.not_in(keep)).execute()
+        model._schema.create_indexes(safe=True)
+    columns = [c.name for c in db.get_columns(QCFile._meta.table_name)]
+    if "stem" not in columns:
+        run_ops(SqliteMigrator(db).add_column(QCFile._meta.table_name, "stem", QCFile.stem))
+    QCFile.bulk_update(
+        [
+            QCFile(id=id, stem=QCFile.make_stem(name))
+            for id, name in QCFile.select(QCFile.id, QCFile.name).tuples()
+        ],
+        fields=["stem"],
+        batch_size=100
+    )
+
+
+def create_search_triggers(db):
+    '''创建SDS/SEC/LAL同步`PidSearch`的触发器'''
+    search = PidSearch._meta.table_name
+    file = QCFile._meta.table_name
+    for model in (SDS, SEC, LAL):
+        table = model._meta.table_name
+        rowid = f"{{row}}.id * 4 + {PidSearch.MODEL_KEYS[table]}"
+        name = f"(SELECT name FROM {file} WHERE id = new.source_id)"
+        db.execute_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {search}(rowid, pid, name) "
+            f"VALUES ({rowid.format(row='new')}, new.pid, {name}); END"
+        )
+        db.execute_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM {search} WHERE rowid = {rowid.format(row='old')}; END"
+        )
+        db.execute_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF pid, source_id ON {table} BEGIN "
+            f"UPDATE {search} SET pid = new.pid, name = {name} "
+            f"WHERE rowid = {rowid.format(row='old')}; END"
+        )
+
+
+def v3_pid_search(db):
+    '''建立pid全文索引及同步触发器, 导入已有结果'''
+    db.create_tables([PidSearch])
+    create_search_triggers(db)
+    for model in (SDS, SEC, LAL):
+        key = PidSearch.MODEL_KEYS[model._meta.table_name]
+        PidSearch.insert_from(
+            model.select(model.id * 4 + key, model.pid, QCFile.name).join(
+                QCFile, on=(model.source == QCFile.id)),
+            fields=[PidSearch.rowid, PidSearch.pid, PidSearch.name]
+        ).execute()
+
+
+def v4_ingest_errors(db):
+    '''新增解析错误表'''
+    db.create_tables([IngestError])
+
+
+def v5_parser_version(db):
+    '''
+    解析缓存及文件新增解析器版本列
+
+    已有记录版本为0, 迁移后首次扫描全部文件重新解析一次。
+    '''
+    migrator = SqliteMigrator(db)
+    for model in (ParseCache, QCFile):
+        columns = [c.name for c in db.get_columns(model._meta.table_name)]
+        field = model.version if model is ParseCache else model.parser
+        if field.column_name not in columns:
+            run_ops(migrator.add_column(model._meta.table_name, field.column_name, field))
+
+
+# 按顺序执行, 版本号即列表序号+1, 只能追加不能修改
+MIGRATIONS = [
+    v1_baseline,
+    v2_natural_keys,
+    v3_pid_search,
+    v4_ingest_errors,
+    v5_parser_version,
+]
+
+
+def migrate(db=LOCALDB, backup_dir: Path = BASE_DIR / "backup") -> int:
+    '''
+    按`PRAGMA user_version`执行未完成的迁移, 应用启动时调用
+
+    新数据库直接按当前模型建表并标记为最新版本, 触发器等非模型对象单独创建;
+    已有数据库迁移前先备份到`backup_dir`, 迁移可能删除重复数据。
+
+    Returns:
+        - int: 迁移后的版本号
+    '''
+    latest = len(MIGRATIONS)
+    with db.bind_ctx(MODELS):
+        version = db.user_version
+        if version == 0 and not db.table_exists(QCFile._meta.table_name):
+            with db.atomic():
+                db.create_tables(MODELS)
+                create_search_triggers(db)
+                db.user_version = latest
+            return latest
+        if version < latest:
+            keep = CONFIG.getint("QCSEEK", "BackupKeep", fallback=5)
+            backup(db, backup_dir, keep)
+        for i in range(version, latest):
+            with db.atomic():
+                MIGRATIONS[i](db)
+                db.user_version = i + 1
+    return latest
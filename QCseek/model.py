@@ -1,23 +1,98 @@
-from pandas import DataFrame
+import os
+import json
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
 from win32api import GetShortPathName
 from peewee import (
-    Model, IntegerField, CharField,
-    DateTimeField, ForeignKeyField
+    Model, IntegerField, CharField, FloatField,
+    TextField, DateTimeField, ForeignKeyField, Case, chunked
 )
 
+from playhouse.sqlite_ext import FTS5Model, SearchField
+
 from Autoseek.settings import LOCALDB
-from .pptx import PPTX
+from .pptx import PPTX, Table
+
+
+def to_ints(column: np.ndarray) -> list[int | None]:
+    '''纯数字文本转为整数, 其余为None; 超过18位的数字不是序号, 同样为None'''
+    # 长数字转int64会溢出, 也无法写入SQLite整数列
+    digit = np.char.isdigit(column) & (np.char.str_len(column) <= 18)
+    numbers = np.where(digit, column, "0").astype(np.int64).tolist()
+    return [n if d else None for n, d in zip(numbers, digit.tolist())]
+
+
+def short_path(pathname: str) -> str:
+    '''获取Windows下文件短路径'''
+    if len(pathname) >= 255:
+        return GetShortPathName(pathname)
+    else:
+        return pathname
 
 
 class BaseModel(Model):
+    # 解析结果行元组字段, 用于跨进程传递
+    ROW_FIELDS = ()
+    # 同一来源文件内判定重复的字段
+    DEDUPE_FIELDS = ()
+
     class Meta:
         database = LOCALDB
 
+    def to_row(self) -> tuple:
+        '''转换为可序列化的行元组'''
+        return tuple(getattr(self, f) for f in self.ROW_FIELDS)
+
+    @classmethod
+    def dedupe(cls, src, rows: list[tuple]) -> list[tuple]:
+        '''一次查询读取来源文件已有数据, 直接按行元组剔除重复, 不创建模型实例'''
+        if src.id is None:
+            return list(rows)
+        fields = [getattr(cls, f) for f in cls.DEDUPE_FIELDS]
+        existing = set(cls.select(*fields).where(cls.source == src.id).tuples())
+        key = [cls.ROW_FIELDS.index(f) for f in cls.DEDUPE_FIELDS]
+        return [r for r in rows if tuple(r[i] for i in key) not in existing]
+
+    @classmethod
+    def parse_table(cls, slide, table: Table, errors: list | None, *args) -> list[tuple]:
+        '''
+        解析单个表格
+
+        `errors`为None时缺列等异常直接抛出;
+        否则记录`(slide序号, 原因)`并跳过该表格, 其余表格照常解析。
+        '''
+        try:
+            return cls.from_table(table, *args)
+        except (IndexError, ValueError) as e:
+            if errors is None:
+                raise
+            errors.append((slide.number, str(e)))
+            return []
+
+    @classmethod
+    def insert_ignore(cls, items: list[tuple[tuple, int]], batch_size: int = 100):
+        '''
+        批量插入, 与自然键唯一索引冲突的行直接忽略
+
+        Args:
+            - `items`: `(行元组, 来源文件id)`列表
+        '''
+        fields = [getattr(cls, f) for f in cls.ROW_FIELDS] + [cls.source]
+        rows = [(*row, source_id) for row, source_id in items]
+        for batch in chunked(rows, batch_size):
+            cls.insert_many(batch, fields=fields).on_conflict_ignore().execute()
+
 
 class QCFile(BaseModel):
     name = CharField(max_length=255, unique=True)
     path = CharField(max_length=255)
     modified = DateTimeField()
+    # 去扩展名的小写文件名, 用于PDF与PPT匹配
+    stem = CharField(max_length=255, null=True, index=True)
+    # 解析时的解析器版本, 与`ParseCache.VERSION`不同时重新解析
+    parser = IntegerField(null=True, default=0)
 
     class ParseError(Exception):
         '''文件解析异常'''
@@ -26,17 +101,18 @@ class QCFile(BaseModel):
             super().__init__(msg)
             self.qcfile = qcfile
 
+    @staticmethod
+    def make_stem(name: str) -> str:
+        '''文件名归一化: 去扩展名、首尾空白并转小写'''
+        return os.path.splitext(name)[0].strip().lower()
+
     @property
     def pathname(self):
         return f"{self.path}/{self.name}"
 
     @property
     def shortpathname(self):
-        '''获取Windows下文件短路径'''
-        if len(self.pathname) >= 255:
-            return GetShortPathName(self.pathname)
-        else:
-            return self.pathname
+        return short_path(self.pathname)
 
 
 class SDS(BaseModel):
@@ -47,68 +123,70 @@ class SDS(BaseModel):
     non_reduced_lane = IntegerField(null=True)
     reduced_lane = IntegerField(null=True)
 
+    ROW_FIELDS = ("pid", "purity", "pic", "non_reduced_lane", "reduced_lane")
+    DEDUPE_FIELDS = ("pid", "purity", "pic")
+
+    class Meta:
+        # 自然键唯一索引, pid在首位, 兼作pid查询索引
+        indexes = ((("pid", "purity", "pic", "source"), True),)
+
     def __str__(self):
         return f"SDS({self.pid},{self.purity})"
 
     @classmethod
-    def from_dataframe(cls, df: DataFrame):
-        pid_i, purity_i = None, None
-        for index in df.columns:
-            if index in ["蛋白编号", "CoA#"]:
-                pid_i = index
-            elif "纯度" in index:
-                purity_i = index
+    def from_table(cls, table: Table, pic: str = None) -> list[tuple]:
+        '''
+        按列提取行元组, 字段见`ROW_FIELDS`
+
+        首列为纯数字时为非还原泳道号, 还原泳道号为其加8。
+        '''
+        pid_i = table.find(["蛋白编号", "CoA#"])
+        purity_i = table.find(lambda head: "纯度" in head)
         if pid_i is None:
             raise IndexError("没有蛋白编号列")
         if purity_i is None:
             raise IndexError("没有纯度值列")
+        columns = table.columns()
+        lanes = to_ints(columns[0])
+        return list(zip(
+            columns[pid_i].tolist(),
+            columns[purity_i].tolist(),
+            [pic] * len(lanes),
+            lanes,
+            [None if no is None else 8 + no for no in lanes],
+        ))
+
+    @classmethod
+    async def from_pptx(cls, ppt: PPTX, errors: list = None) -> list[tuple]:
+        '''
+        从PPTX解析SDS行元组, 不访问数据库
+
+        传入`errors`时为容错模式, 见`parse_table`。
+        '''
         res = []
-        for i in df.index:
-            sds = cls(pid=df[pid_i][i], purity=df[purity_i][i])
-            no = int(df.iloc[i, 0]) if df.iloc[i, 0].isdigit() else None
-            if no is not None:
-                sds.non_reduced_lane = no
-                sds.reduced_lane = 8 + no
-            res.append(sds)
+        async for slide in ppt.iter_slides():
+            tables = slide.get_tables()
+            tables = [t for t in tables if len(t.header) <= 10]
+            if not tables:
+                continue
+            images = slide.get_image_names()
+            if not images:
+                if errors is None:
+                    raise ValueError("NoImage")
+                errors.append((slide.number, "NoImage"))
+                continue
+            # 同一张幻灯片中会出现幽灵图片，不能抛出多图异常，暂取第一张图
+            # if len(images) > 1:
+            #     raise ValueError("MultiImages")
+            for t in tables:
+                res += cls.parse_table(slide, t, errors, images[0])
         return res
 
     @classmethod
     async def from_qcfile(cls, src: QCFile) -> list:
-        res = []
         async with PPTX(src.shortpathname) as ppt:
-            slides = await ppt.slides()
-            for slide in slides:
-                tables = slide.get_tables()
-                tables = [t for t in tables if len(t.columns) <= 10]
-                if not tables:
-                    continue
-                images = slide.get_image_names()
-                if not images:
-                    raise ValueError("NoImage")
-                # 同一张幻灯片中会出现幽灵图片，不能抛出多图异常，暂取第一张图
-                # if len(images) > 1:
-                #     raise ValueError("MultiImages")
-                sds_list = [cls.from_dataframe(t) for t in tables]
-                # 解决部分表无相关信息列方案
-                # sds_list = []
-                # for t in tables:
-                #     try:
-                #         sds = cls.from_dataframe(t)
-                #         sds_list.append(sds)
-                #     except IndexError:
-                #         pass
-                sds_list = sum(sds_list, [])
-                for sds in sds_list:
-                    sds.source, sds.pic = src, images[0]
-                    # 剔除数据库重复数据, 可能有性能问题
-                    if not SDS.get_or_none(
-                        pid=sds.pid,
-                        purity=sds.purity,
-                        source=sds.source,
-                        pic=sds.pic
-                    ):
-                        res.append(sds)
-        return res
+            rows = await cls.from_pptx(ppt)
+        return [(r, src.id) for r in cls.dedupe(src, rows)]
 
 
 class SEC(BaseModel):
@@ -121,25 +199,28 @@ class SEC(BaseModel):
     attach = ForeignKeyField(QCFile, backref="sec_attach_set", null=True)
     pic_num = IntegerField(null=True)
 
+    ROW_FIELDS = ("pid", "retention_time", "hmw", "monomer", "lmw", "pic_num")
+    DEDUPE_FIELDS = ("pid", "retention_time", "hmw", "monomer", "lmw")
+
+    class Meta:
+        indexes = ((("pid", "retention_time", "hmw", "monomer", "lmw", "source"), True),)
+
     def __str__(self) -> str:
         return f"SEC({self.pid}, {self.monomer})"
 
     @classmethod
-    def from_dataframe(cls, df: DataFrame):
-        pid_i, rt_i, hmw_i, monomer_i, lmw_i, pic_i = None, None, None, None, None, None
-        for index in df.columns:
-            if index in ["蛋白编号", "CoA编号", "P编号"]:
-                pid_i = index
-            elif index in ["单体保留时间（min）"]:
-                rt_i = index
-            elif index in ["高分子聚合物(%)"]:
-                hmw_i = index
-            elif index in ["单体(%)"]:
-                monomer_i = index
-            elif index in ["低分子量物质(%)"]:
-                lmw_i = index
-            elif index in ["PDF对应页码"]:
-                pic_i = index
+    def from_table(cls, table: Table) -> list[tuple]:
+        '''
+        按列提取行元组, 字段见`ROW_FIELDS`
+
+        无"PDF对应页码"列时以首列为页码, 非纯数字时为None。
+        '''
+        pid_i = table.find(["蛋白编号", "CoA编号", "P编号"])
+        rt_i = table.find(["单体保留时间（min）"])
+        hmw_i = table.find(["高分子聚合物(%)"])
+        monomer_i = table.find(["单体(%)"])
+        lmw_i = table.find(["低分子量物质(%)"])
+        pic_i = table.find(["PDF对应页码"])
         if pid_i is None:
             raise IndexError("NoPidColumn")
         if rt_i is None:
@@ -150,57 +231,45 @@ class SEC(BaseModel):
             raise IndexError("NoMonomerColumn")
         if lmw_i is None:
             raise IndexError("NoLMWColumn")
+        columns = table.columns()
+        pic_nums = to_ints(columns[0 if pic_i is None else pic_i])
+        return list(zip(
+            *(columns[i].tolist() for i in (pid_i, rt_i, hmw_i, monomer_i, lmw_i)),
+            pic_nums
+        ))
+
+    @classmethod
+    async def from_pptx(cls, ppt: PPTX, errors: list = None) -> list[tuple]:
+        '''
+        从PPTX解析SEC行元组, 不访问数据库
+
+        传入`errors`时为容错模式, 见`parse_table`。
+        '''
         res = []
-        for i in df.index:
-            sec = cls(
-                pid=df[pid_i][i],
-                retention_time=df[rt_i][i],
-                hmw=df[hmw_i][i],
-                monomer=df[monomer_i][i],
-                lmw=df[lmw_i][i]
-            )
-            pic_num = df.iloc[i, 0] if pic_i is None else df[pic_i][i]
-            pic_num = int(pic_num) if pic_num.isdigit() else None
-            if pic_num is not None:
-                sec.pic_num = pic_num
-            res.append(sec)
+        async for slide in ppt.iter_slides():
+            for t in slide.get_tables():
+                res += cls.parse_table(slide, t, errors)
         return res
 
     @classmethod
     async def from_qcfile(cls, src: QCFile):
-        res = []
         async with PPTX(src.shortpathname) as ppt:
-            tables = await ppt.get_tables()
-            sec_list = [cls.from_dataframe(t) for t in tables]
-            # 解决部分表无相关信息列方案
-            # sec_list = []
-            # for t in tables:
-            #     try:
-            #         sec = cls.from_dataframe(t)
-            #         sec.append(sec)
-            #     except IndexError:
-            #         pass
-            sec_list = sum(sec_list, [])
-            for sec in sec_list:
-                sec.source = src
-                if not SEC.get_or_none(
-                    pid=sec.pid,
-                    retention_time=sec.retention_time,
-                    hmw=sec.hmw,
-                    monomer=sec.monomer,
-                    lmw=sec.lmw,
-                    source=sec.source
-                ):
-                    res.append(sec)
-        return res
+            rows = await cls.from_pptx(ppt)
+        return [(r, src.id) for r in cls.dedupe(src, rows)]
 
     @classmethod
     def add_attach(cls, src: QCFile):
-        pdf = src.name[:-4]
+        # 优先按stem索引精确匹配, 无结果时回退到文件名包含匹配
         query = cls.select().join(
             QCFile,
             on=(cls.source == QCFile.id)
-        ).where(QCFile.name.contains(pdf))
+        ).where(QCFile.stem == QCFile.make_stem(src.name))
+        if not query:
+            pdf = src.name[:-4]
+            query = cls.select().join(
+                QCFile,
+                on=(cls.source == QCFile.id)
+            ).where(QCFile.name.contains(pdf))
         if not query:
             raise ValueError("NoRelatedPPT")
         updating = []
@@ -209,61 +278,264 @@ class SEC(BaseModel):
             updating.append(i)
         return updating
 
+    @classmethod
+    def match_attach(cls, pdfs: list[QCFile]) -> tuple[dict, list, list]:
+        '''
+        批量匹配PDF与SEC PPT文件
+
+        一次查询读取全部SEC来源文件, 在内存中按stem精确匹配,
+        无结果时回退到文件名包含匹配; 同一PDF匹配多个PPT时全部添加附件。
+        多个PDF匹配同一PPT时优先唯一的stem精确匹配, 否则该PPT不添加附件;
+        未采用的PDF均记为歧义错误, 其余匹配不受影响。
+
+        Args:
+            - `pdfs`: PDF文件列表
+
+        Returns:
+            - dict: `{PPT文件id: PDF文件}`
+            - list: `[(PDF文件, 错误信息)]`
+            - list: 无匹配PPT的PDF文件, 下次扫描重试
+        '''
+        sources = QCFile.select(QCFile.id, QCFile.name, QCFile.stem).where(
+            QCFile.id.in_(cls.select(cls.source).distinct())
+        ).tuples()
+        stems: dict[str, list[int]] = {}
+        names = {}
+        for id, name, stem in sources:
+            stems.setdefault(stem or QCFile.make_stem(name), []).append(id)
+            names[id] = name
+        # PPT id -> [(PDF文件, 是否stem精确匹配)]
+        claims: dict[int, list[tuple[QCFile, bool]]] = {}
+        errors, unmatched = [], []
+        for pdf in pdfs:
+            ids = stems.get(QCFile.make_stem(pdf.name))
+            exact = ids is not None
+            if not exact:
+                key = pdf.name[:-4]
+                ids = [id for id, name in names.items() if key in name]
+            if not ids:
+                errors.append((pdf, "NoRelatedPPT"))
+                unmatched.append(pdf)
+            for id in ids:
+                claims.setdefault(id, []).append((pdf, exact))
+        matched = {}
+        for id, claim in claims.items():
+            if len(claim) == 1:
+                matched[id] = claim[0][0]
+                continue
+            exact = [pdf for pdf, e in claim if e]
+            winner = exact[0] if len(exact) == 1 else None
+            if winner is not None:
+                matched[id] = winner
+            errors += [
+                (pdf, f"MultiRelatedPDF({names[id]})")
+                for pdf, _ in claim if pdf is not winner
+            ]
+        return matched, errors, unmatched
+
+    @classmethod
+    def bulk_attach(cls, matched: dict, batch_size: int = 100):
+        '''按来源文件批量更新attach, 每批一条UPDATE语句'''
+        items = list(matched.items())
+        for batch in chunked(items, batch_size):
+            cls.update(
+                attach=Case(cls.source, [(ppt, pdf.id) for ppt, pdf in batch])
+            ).where(cls.source.in_([ppt for ppt, _ in batch])).execute()
+
 
 class LAL(BaseModel):
     pid = CharField(max_length=20)
     value = CharField(max_length=20)
     source = ForeignKeyField(QCFile, backref="lal_set", on_delete="CASCADE")
 
+    ROW_FIELDS = ("pid", "value")
+    DEDUPE_FIELDS = ("pid", "value")
+
+    class Meta:
+        indexes = ((("pid", "value", "source"), True),)
+
     def __str__(self) -> str:
         return f"LAL({self.pid}, {self.value})"
 
     @classmethod
-    def from_dataframe(cls, df: DataFrame):
-        pid_i, lal_i = None, None
-        for index in df.columns:
-            if index in ["蛋白编号", "CoA#", "P编号"]:
-                pid_i = index
-            elif index in ["结果(EU/mg)"]:
-                lal_i = index
+    def from_table(cls, table: Table) -> list[tuple]:
+        '''按列提取行元组, 字段见`ROW_FIELDS`, 跳过蛋白编号为空的行'''
+        pid_i = table.find(["蛋白编号", "CoA#", "P编号"])
+        lal_i = table.find(["结果(EU/mg)"])
         if pid_i is None:
             raise IndexError("NoPidColumn")
         if lal_i is None:
             # return []
             raise IndexError("NoLALColumn")
+        columns = table.columns()
+        filled = np.char.strip(columns[pid_i]) != ""
+        return list(zip(
+            columns[pid_i][filled].tolist(),
+            columns[lal_i][filled].tolist()
+        ))
+
+    @classmethod
+    async def from_pptx(cls, ppt: PPTX, errors: list = None) -> list[tuple]:
+        '''
+        从PPTX解析LAL行元组, 不访问数据库
+
+        传入`errors`时为容错模式, 见`parse_table`。
+        '''
         res = []
-        for i in df.index:
-            if (not df[pid_i][i]) or (df[pid_i][i].isspace()):
-                continue
-            lal = cls(pid=df[pid_i][i], value=df[lal_i][i])
-            # lal = cls(pid=df.iloc[i, 1], value=df.iloc[i, 4])
-            res.append(lal)
+        async for slide in ppt.iter_slides():
+            for t in slide.get_tables():
+                res += cls.parse_table(slide, t, errors)
         return res
 
     @classmethod
     async def from_qcfile(cls, src: QCFile):
-        res = []
         async with PPTX(src.shortpathname) as ppt:
-            tables = await ppt.get_tables()
-            lal_list = [cls.from_dataframe(t) for t in tables]
-            # 解决部分表无相关信息列方案
-            # lal_list = []
-            # for t in tables:
-            #     try:
-            #         lal = cls.from_dataframe(t)
-            #         lal_list.append(lal)
-            #     except IndexError:
-            #         pass
-            lal_list = sum(lal_list, [])
-            for lal in lal_list:
-                lal.source = src
-                if not LAL.get_or_none(
-                    pid=lal.pid,
-                    value=lal.value,
-                    source=lal.source
-                ):
-                    res.append(lal)
-        return res
+            rows = await cls.from_pptx(ppt)
+        return [(r, src.id) for r in cls.dedupe(src, rows)]
+
+
+class Tombstone(BaseModel):
+    '''已从数据源消失的文件, 其检测结果已删除'''
+    source = ForeignKeyField(QCFile, backref="tombstone_set", unique=True, on_delete="CASCADE")
+    deleted = DateTimeField()
+
+
+class ParseCache(BaseModel):
+    '''
+    解析结果缓存, 以文件内容摘要为键, 与文件名、路径及mtime无关
+
+    版本号与`VERSION`不同的缓存视为未命中, 修改解析逻辑后已有文件会重新解析。
+    '''
+    digest = CharField(max_length=64)
+    model = CharField(max_length=10)
+    rows = TextField()  # JSON: 行元组列表, 字段见`ROW_FIELDS`
+    version = IntegerField(null=True, default=0)
+
+    # 解析器版本, 修改`from_pptx`/`from_table`等解析逻辑时加1, 全部文件随之重新解析
+    VERSION = 1
+
+    class Meta:
+        indexes = ((("digest", "model"), True),)
+
+    @classmethod
+    def lookup(cls, digest: str, model) -> list[tuple] | None:
+        '''查找缓存的行元组'''
+        cache = cls.get_or_none(digest=digest, model=model.__name__, version=cls.VERSION)
+        if cache is None:
+            return None
+        return [tuple(r) for r in json.loads(cache.rows)]
+
+    @classmethod
+    def store(cls, digest: str, model, rows: list[tuple]):
+        '''写入缓存'''
+        cls.insert(
+            digest=digest,
+            model=model.__name__,
+            rows=json.dumps(rows, ensure_ascii=False),
+            version=cls.VERSION
+        ).on_conflict_replace().execute()
+
+
+class IngestError(BaseModel):
+    '''
+    解析失败的表格, 以文件内容摘要为键
+
+    `slide`为None时整个文件解析失败; 内容不变的文件由`ParseCache`命中, 不再重复解析。
+    '''
+    digest = CharField(max_length=64, index=True)
+    model = CharField(max_length=10)
+    slide = IntegerField(null=True)
+    reason = CharField(max_length=255)
+    created = DateTimeField()
+
+    @classmethod
+    def lookup(cls, digest: str, model) -> list[tuple[int | None, str]]:
+        '''查找已记录的错误'''
+        query = cls.select(cls.slide, cls.reason).where(
+            (cls.digest == digest) & (cls.model == model.__name__)
+        ).order_by(cls.id).tuples()
+        return list(query)
+
+    @classmethod
+    def store(cls, digest: str, model, errors: list[tuple[int | None, str]]):
+        '''写入错误, 替换该文件已有记录'''
+        cls.delete().where((cls.digest == digest) & (cls.model == model.__name__)).execute()
+        if errors:
+            now = datetime.now()
+            cls.insert_many(
+                [(digest, model.__name__, slide, reason[:255], now) for slide, reason in errors],
+                fields=[cls.digest, cls.model, cls.slide, cls.reason, cls.created]
+            ).execute()
+
+
+class ScanDir(BaseModel):
+    '''目录扫描索引, 记录目录mtime及其子目录、文件stat'''
+    path = CharField(max_length=255, unique=True)
+    mtime = FloatField()
+    entries = TextField()   # JSON: {"dirs": [[path, mtime], ...], "files": [[name, size, mtime], ...]}
+
+
+
+class PidSearch(FTS5Model):
+    '''
+    pid及来源文件名trigram全文索引, 支持子串及模糊查询
+
+    每行对应一条SDS/SEC/LAL结果, rowid为`id*4+模型序号`,
+    由迁移中创建的触发器随结果表增删同步维护。
+    '''
+    pid = SearchField()
+    name = SearchField()
+
+    # rowid中的模型序号
+    MODEL_KEYS = {"sds": 1, "sec": 2, "lal": 3}
+
+    class Meta:
+        database = LOCALDB
+        options = {"tokenize": "trigram"}
+
+
+# 查询结果: 只读元组, 来源文件随查询一次读取, 不会触发外键懒加载
+class FileRef(NamedTuple):
+    '''来源文件快照, 字段同`QCFile`'''
+    id: int
+    path: str
+    name: str
+    modified: datetime
+
+    @property
+    def pathname(self):
+        return f"{self.path}/{self.name}"
+
+    @property
+    def shortpathname(self):
+        return short_path(self.pathname)
+
+
+class SDSResult(NamedTuple):
+    id: int
+    pid: str
+    purity: str
+    pic: str
+    non_reduced_lane: int | None
+    reduced_lane: int | None
+    source: FileRef
+
+
+class SECResult(NamedTuple):
+    id: int
+    pid: str
+    retention_time: str
+    hmw: str
+    monomer: str
+    lmw: str
+    pic_num: int | None
+    source: FileRef
+    attach: FileRef | None
+
 
+class LALResult(NamedTuple):
+    id: int
+    pid: str
+    value: str
+    source: FileRef
 
-LOCALDB.create_tables([SDS, SEC, LAL, QCFile])
@@ -0,0 +1,133 @@
+from datetime import datetime
+
+from peewee import JOIN, chunked
+
+from .model import QCFile, SDS, SEC, LAL, Tombstone, ParseCache
+from .scanner import FileRecord
+
+
+class ChangeSet:
+    '''扫描结果与`QCFile`表的差异, 按文件名索引'''
+
+    def __init__(self):
+        self.new: dict[str, QCFile] = {}
+        self.modified: dict[str, QCFile] = {}
+        self.moved: dict[str, QCFile] = {}
+        self.deleted: dict[str, int] = {}
+        self.revived: dict[str, int] = {}
+        self.failed: dict[str, int] = {}
+
+    def __str__(self) -> str:
+        return (f"ChangeSet(new={len(self.new)}, modified={len(self.modified)}, "
+                f"moved={len(self.moved)}, deleted={len(self.deleted)}, "
+                f"revived={len(self.revived)})")
+
+    def discard(self, qcfile: QCFile):
+        '''解析失败的文件不入库, 已有记录删除以便下次重试'''
+        if self.new.pop(qcfile.name, None) is None:
+            qcfile = self.modified.pop(qcfile.name, None)
+            if qcfile is not None:
+                self.failed[qcfile.name] = qcfile.id
+
+    def apply(self):
+        '''批量写入`QCFile`, 需在事务中调用'''
+        QCFile.bulk_create(list(self.new.values()), batch_size=100)
+        QCFile.bulk_update(
+            [*self.modified.values(), *self.moved.values()],
+            fields=["path", "modified", "parser"],
+            batch_size=100
+        )
+        for batch in chunked(list(self.failed.values()), 100):
+            QCFile.delete().where(QCFile.id.in_(batch)).execute()
+        # 回填新建记录id
+        for batch in chunked(list(self.new), 100):
+            query = QCFile.select(QCFile.id, QCFile.name).where(
+                QCFile.name.in_(batch)).tuples()
+            for id, name in query:
+                self.new[name].id = id
+
+    def reconcile(self):
+        '''
+        标记消失文件并删除其检测结果, 需在事务中调用
+
+        文件重新出现时清除标记, 由`feed`作为已修改文件重新解析。
+        '''
+        for batch in chunked(list(self.revived.values()), 100):
+            Tombstone.delete().where(Tombstone.source.in_(batch)).execute()
+        now = datetime.now()
+        for batch in chunked(list(self.deleted.values()), 100):
+            SEC.update(attach=None).where(SEC.attach.in_(batch)).execute()
+            for model in (SDS, SEC, LAL):
+                model.delete().where(model.source.in_(batch)).execute()
+            Tombstone.insert_many(
+                [(i, now) for i in batch],
+                fields=[Tombstone.source, Tombstone.deleted]
+            ).on_conflict_ignore().execute()
+
+
+class ChangePlanner:
+    '''
+    变更计划器
+
+    一次查询读取全部`QCFile`, 扫描记录逐个输入并在内存中比对, 支持流式扫描。
+    同名文件存在多份时以mtime最新者为准。
+    '''
+
+    def __init__(self, known: dict):
+        self.known = known  # name -> (id, path, modified, tombstone, parser)
+        self.seen: dict[str, FileRecord] = {}
+        self.paths: dict[str, set] = {}
+        self.changes = ChangeSet()
+
+    @classmethod
+    def load(cls):
+        '''读取全部已知文件'''
+        query = QCFile.select(
+            QCFile.id, QCFile.name, QCFile.path, QCFile.modified,
+            Tombstone.id.is_null(False), QCFile.parser
+        ).join(Tombstone, JOIN.LEFT_OUTER).tuples()
+        return cls({row[1]: (row[0], *row[2:]) for row in query})
+
+    def feed(self, file: FileRecord) -> QCFile | None:
+        '''
+        输入扫描记录
+
+        Returns:
+            - QCFile: 新增或已修改, 需要解析的文件
+            - None: 未修改
+        '''
+        name = file.name
+        self.paths.setdefault(name, set()).add(file.path)
+        chosen = self.seen.get(name)
+        if chosen is not None and chosen.mtime >= file.mtime:
+            return None
+        self.seen[name] = file
+        known = self.known.get(name)
+        if known is None:
+            qcfile = self.changes.new.setdefault(name, QCFile(
+                name=name, stem=QCFile.make_stem(name), parser=ParseCache.VERSION))
+        elif known[3] or known[2] < file.modified or known[4] != ParseCache.VERSION:
+            # 已标记删除的文件重新出现, 其结果已删除, 需重新解析;
+            # 解析器版本变化的文件同样重新解析
+            if known[3]:
+                self.changes.revived[name] = known[0]
+            qcfile = self.changes.modified.setdefault(
+                name, QCFile(id=known[0], name=name, parser=ParseCache.VERSION))
+        else:
+            return None
+        qcfile.path = file.path
+        qcfile.modified = file.modified
+        return qcfile
+
+    def finish(self) -> ChangeSet:
+        '''扫描结束, 计算移动及删除的文件'''
+        changes = self.changes
+        for name, (id, path, modified, tombstone, parser) in self.known.items():
+            file = self.seen.get(name)
+            if file is None:
+                if not tombstone:
+                    changes.deleted[name] = id
+            elif (name not in changes.modified) and (path not in self.paths[name]):
+                changes.moved[name] = QCFile(
+                    id=id, name=name, path=file.path, modified=modified, parser=parser)
+        return changes
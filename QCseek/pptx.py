@@ -1,82 +1,144 @@
+import os
 import asyncio
+from io import BytesIO
 from zipfile import ZipFile
 import xml.etree.ElementTree as ET
+from typing import NamedTuple
 
 import cv2
 import numpy as np
 from pandas import DataFrame
 
 
+# OOXML固定命名空间
+A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+R = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+TITLE = f"{P}nvSpPr/{P}nvPr/{P}ph[@type='title']"
+
+
+class Table(NamedTuple):
+    '''
+    幻灯片表格, 表头及数据行均为字符串元组
+
+    数据行按表头宽度补齐或截断; 需要时再转为`DataFrame`。
+    '''
+    header: tuple[str, ...]
+    rows: list[tuple[str, ...]]
+
+    @classmethod
+    def from_rows(cls, rows: list[list[str]]):
+        '''首行为表头'''
+        width = len(rows[0])
+        pad = ("",) * width
+        return cls(tuple(rows[0]), [(*r, *pad)[:width] for r in rows[1:]])
+
+    def find(self, match) -> int | None:
+        '''
+        按表头查找列序号, 多列匹配时取最后一列
+
+        Args:
+            - `match`: 表头候选列表, 或以表头为参数的判断函数
+        '''
+        if not callable(match):
+            match = match.__contains__
+        index = None
+        for i, head in enumerate(self.header):
+            if match(head):
+                index = i
+        return index
+
+    def columns(self) -> np.ndarray:
+        '''按列转为numpy字符串数组, 形状为`(列数, 行数)`'''
+        return np.array(self.rows, dtype=str).reshape(len(self.rows), len(self.header)).T
+
+    def to_dataframe(self) -> DataFrame:
+        return DataFrame(self.rows, columns=self.header)
+
+
 class Slide:
     '''
-    异步风格Slide操作类, 支持`async`/`await`
+    Slide解析类, 单次解析XML提取表格、图片关系及标题序号
     '''
 
     def __init__(self):
-        self._bs = None
-        self._rel = None
-        self.ns = {}
-        self.rns = {}
-
-    async def from_bufferedIO(self, file, rel):
-        '''从字节流中初始化解析器'''
-        # 读取XML命名空间
-        ns_coro = asyncio.to_thread(ET.iterparse, file, ["start-ns"])
-        rns_coro = asyncio.to_thread(ET.iterparse, rel, ["start-ns"])
-        ns, rns = await asyncio.gather(ns_coro, rns_coro)
-        self.ns = dict([i for _, i in ns])
-        self.rns = dict([i for _, i in rns])
-        # 恢复文件指针，重新初始化ET解析器
-        file.seek(0)
-        rel.seek(0)
-        t_file = asyncio.to_thread(ET.parse, file)
-        t_rel = asyncio.to_thread(ET.parse, rel)
-        self._bs, self._rel = await asyncio.gather(t_file, t_rel)
-        return self
-
-    def get_tables(self) -> list[DataFrame]:
-        '''Get standard tables in slide'''
-        res = []
-        for table_tag in self._bs.findall(".//a:graphicData", self.ns):
-            rows = table_tag.findall(".//a:tr", self.ns)
-            if not rows or len(rows) < 2:
+        self.tables: list[Table] = []
+        self.images: list[str] = []
+        self.index: int | None = None
+        self.number: int | None = None  # slide文件序号, 用于错误报告
+
+    @classmethod
+    def from_bytes(cls, data: bytes, rel: bytes = None):
+        '''从slide及rels字节流解析, 每个文件只解析一次'''
+        slide = cls()
+        root = ET.fromstring(data)
+        for graphic in root.iter(A + "graphicData"):
+            rows = [
+                ["".join(col.itertext()) for col in row.iter(A + "tc")]
+                for row in graphic.iter(A + "tr")
+            ]
+            if len(rows) >= 2:
+                slide.tables.append(Table.from_rows(rows))
+        for sp in root.iter(P + "sp"):
+            if sp.find(TITLE) is not None:
+                try:
+                    slide.index = int("".join(sp.itertext()).strip())
+                except ValueError:
+                    pass
+                break
+        if rel:
+            # 这样获取的图片可能存在显示与原图片发生变换
+            slide.images = [
+                r.get("Target").replace("..", "ppt")
+                for r in ET.fromstring(rel).iter(R + "Relationship")
+                if "media" in r.get("Target")
+            ]
+        return slide
+
+    @staticmethod
+    def read_index(data: bytes) -> int | None:
+        '''仅读取标题序号, 找到标题占位符后立即停止解析'''
+        for _, elem in ET.iterparse(BytesIO(data)):
+            if elem.tag != P + "sp":
                 continue
-            heads = ["".join(col.itertext())
-                     for col in rows[0].findall(".//a:tc", self.ns)]
-            data = [["".join(col.itertext()) for col in row.findall(
-                ".//a:tc", self.ns)] for row in rows[1:]]
-            res.append(DataFrame(data, columns=heads))
-        return res
+            if elem.find(TITLE) is not None:
+                try:
+                    return int("".join(elem.itertext()).strip())
+                except ValueError:
+                    return None
+            elem.clear()
+        return None
+
+    def get_tables(self) -> list[Table]:
+        '''Get standard tables in slide'''
+        return list(self.tables)
+
+    def get_dataframes(self) -> list[DataFrame]:
+        '''以`DataFrame`返回表格'''
+        return [t.to_dataframe() for t in self.tables]
 
     def get_image_names(self):
-        # 这样获取的图片可能存在显示与原图片发生变换
-        relations = self._rel.findall(".//Relationship", self.rns)
-        image_list = [
-            r.get("Target").replace("..", "ppt")
-            for r in relations
-            if "media" in r.get("Target")
-        ]
-        return image_list
+        return list(self.images)
 
     def get_index(self):
         '''获取标题序号'''
-        title = self._bs.find(".//p:ph[@type='title']/../../..", self.ns)
-        if title is None:
-            return None
-        try:
-            return int("".join(title.itertext()).strip())
-        except:
-            return None
+        return self.index
 
 
 class PPTX:
     '''
     异步风格PPT操作类, 支持`async`/`await`
+
+    全部在内存中读取; 调试时设置`dump_dir`可将解析的slide XML写出到该目录。
     '''
+    dump_dir = None
 
-    def __init__(self, path):
+    def __init__(self, path, dump_dir: str = None):
         self._path = path
         self._zipfile = None
+        self._titles = None
+        if dump_dir is not None:
+            self.dump_dir = dump_dir
 
     async def __aenter__(self):
         self._zipfile = await asyncio.to_thread(ZipFile, self._path)
@@ -92,29 +154,68 @@ class PPTX:
         fp = await asyncio.to_thread(self._zipfile.open, file)
         return fp
 
+    def read_slide(self, file: str) -> Slide:
+        '''读取并解析slide及其rels'''
+        rel = f"ppt/slides/_rels/{file.split('/')[-1]}.rels"
+        try:
+            rel_data = self._zipfile.read(rel)
+        except KeyError:
+            rel_data = None
+        data = self._zipfile.read(file)
+        if self.dump_dir is not None:
+            dst = os.path.join(self.dump_dir, file)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst, "wb") as f:
+                f.write(data)
+        slide = Slide.from_bytes(data, rel_data)
+        slide.number = int(file.rsplit("slide", 1)[-1].split(".")[0])
+        return slide
+
     async def get_slide(self, file: str) -> Slide:
         if not file.startswith("ppt/slides/slide"):
             raise ValueError(f"{file} is not a slide")
-        self._zipfile.extract(file)
-        rel = f"ppt/slides/_rels/{file.split('/')[-1]}.rels"
-        fp, frel = await asyncio.gather(self.open(file), self.open(rel))
-        with fp, frel:
-            return await Slide().from_bufferedIO(fp, frel)
+        return await asyncio.to_thread(self.read_slide, file)
 
-    async def slides(self) -> list[Slide]:
+    @property
+    def slide_files(self) -> list[str]:
         if self._zipfile is None:
             raise ValueError
-        tasks = [
-            self.get_slide(file)
-            for file in self._zipfile.namelist()
+        return [
+            file for file in self._zipfile.namelist()
             if file.startswith("ppt/slides/slide")
         ]
+
+    async def slides(self) -> list[Slide]:
+        tasks = [self.get_slide(file) for file in self.slide_files]
         return await asyncio.gather(*tasks)
 
-    async def get_tables(self) -> list[DataFrame]:
-        slides = await self.slides()
-        tables = [slide.get_tables() for slide in slides]
-        return sum(tables, [])
+    async def iter_slides(self):
+        '''逐个解析slide, 同一时刻只保留一个slide的XML树'''
+        for file in self.slide_files:
+            yield await self.get_slide(file)
+
+    def _build_titles(self) -> dict[int, str]:
+        titles = {}
+        for file in self.slide_files:
+            index = Slide.read_index(self._zipfile.read(file))
+            if index is not None:
+                titles.setdefault(index, file)
+        return titles
+
+    async def slide_by_index(self, index: int) -> Slide | None:
+        '''根据标题序号获取slide, 首次调用时仅读取各slide标题建立索引'''
+        if self._titles is None:
+            self._titles = await asyncio.to_thread(self._build_titles)
+        file = self._titles.get(index)
+        if file is None:
+            return None
+        return await self.get_slide(file)
+
+    async def get_tables(self) -> list[Table]:
+        tables = []
+        async for slide in self.iter_slides():
+            tables += slide.get_tables()
+        return tables
 
     async def get_image_by_name(self, xref: str):
         '''根据名称索引读取二进制图片数据'''
@@ -123,20 +224,10 @@ class PPTX:
 
     async def get_image_by_index(self, index: int):
         '''根据序号索引读取二进制图片数据'''
-        slides = await self.slides()
-        for i in slides:
-            if i.get_index() and i.get_index() == index:
-                images = i.get_image_names()
-                img_name = images[0] if len(images) == 1 else images[1]
-                img = await self.get_image_by_name(img_name)
-                return img
-
-
-async def main():
-    async with PPTX("sec.pptx") as ppt:
-        slides = await ppt.slides()
-        index = slides[3].get_index()
-        print(index)
-
-if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+        slide = await self.slide_by_index(index) if index else None
+        if slide is None:
+            return None
+        images = slide.get_image_names()
+        img_name = images[0] if len(images) == 1 else images[1]
+        img = await self.get_image_by_name(img_name)
+        return img
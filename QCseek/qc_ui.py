@@ -119,6 +119,10 @@ class Ui_Qc(object):
         self.searchButton.setMinimumSize(QtCore.QSize(40, 25))
         self.searchButton.setObjectName("searchButton")
         self.horizontalLayout_3.addWidget(self.searchButton)
+        self.importButton = QtWidgets.QPushButton(parent=self.frame_2)
+        self.importButton.setMinimumSize(QtCore.QSize(40, 25))
+        self.importButton.setObjectName("importButton")
+        self.horizontalLayout_3.addWidget(self.importButton)
         self.deleteButton = QtWidgets.QPushButton(parent=self.frame_2)
         self.deleteButton.setMinimumSize(QtCore.QSize(40, 25))
         self.deleteButton.setObjectName("deleteButton")
@@ -156,6 +160,8 @@ class Ui_Qc(object):
         self.title.setText(_translate("Qc", "我的数据"))
         self.searchEdit.setPlaceholderText(_translate("Qc", "蛋白编号"))
         self.searchButton.setText(_translate("Qc", "搜索"))
+        self.importButton.setToolTip(_translate("Qc", "从文件导入蛋白编号"))
+        self.importButton.setText(_translate("Qc", "导入"))
         self.deleteButton.setText(_translate("Qc", "删除"))
         self.exportButton.setText(_translate("Qc", "导出"))
         self.coaButton.setText(_translate("Qc", "CoA"))
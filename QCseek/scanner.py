@@ -0,0 +1,194 @@
+import os
+import json
+import asyncio
+import threading
+from datetime import datetime
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from peewee import chunked
+
+from Autoseek.settings import LOCALDB
+from Autoseek.database import WRITER
+from .model import ScanDir
+
+
+def is_qcfile(name: str) -> bool:
+    '''是否为待扫描的PPTX/PDF文件, 排除Windows临时文件'''
+    if name.startswith("~$"):
+        return False
+    name = name.lower()
+    return name.endswith("pptx") or name.endswith("pdf")
+
+
+class FileRecord(NamedTuple):
+    '''扫描文件记录, stat数据来自DirEntry'''
+    path: str
+    name: str
+    size: int
+    mtime: float
+
+    @classmethod
+    def from_path(cls, path: str, name: str):
+        '''从路径stat创建记录'''
+        st = os.stat(os.path.join(path, name))
+        return cls(path, name, st.st_size, st.st_mtime)
+
+    @property
+    def modified(self) -> datetime:
+        return datetime.fromtimestamp(self.mtime)
+
+
+class DirIndex:
+    '''
+    持久化目录索引
+
+    目录mtime未变化时直接使用索引中的子目录及文件记录, 不再列举目录。
+    注意: 目录mtime仅在其直接子项增删、重命名时变化, 子目录需逐个stat检查,
+    每个目录仍需一次往返, 节省的是列举大目录的数据量而非往返次数;
+    文件原位覆盖不改变目录mtime, 命中时使用索引中的stat, 覆盖的文件不会被发现,
+    此类共享目录需设置`DirIndex = false`关闭索引。
+    '''
+
+    def __init__(self, dirs: dict = None):
+        # path -> (mtime, {"dirs": [...], "files": [...]})
+        self.dirs = dirs or {}
+        self.visited = set()
+        self.changed = set()
+
+    @classmethod
+    def load(cls):
+        '''从数据库读取索引'''
+        dirs = {
+            path: (mtime, json.loads(entries))
+            for path, mtime, entries in ScanDir.select(
+                ScanDir.path, ScanDir.mtime, ScanDir.entries
+            ).tuples()
+        }
+        return cls(dirs)
+
+    def listdir(self, path: str, mtime: float = None) -> tuple[list, list[FileRecord]]:
+        '''
+        列举目录
+
+        Args:
+            - `path`: 目录路径
+            - `mtime`: 目录mtime, 已知时(来自父目录DirEntry)免去一次stat
+
+        Returns:
+            - list: 子目录`(path, mtime)`列表, 索引命中时mtime为None(需重新stat)
+            - list[FileRecord]: 文件记录列表, 索引命中时stat来自索引
+        '''
+        path = os.fspath(path)
+        if mtime is None:
+            mtime = os.stat(path).st_mtime
+        self.visited.add(path)
+        cached = self.dirs.get(path)
+        if cached is not None and cached[0] == mtime:
+            entries = cached[1]
+            dirs = [(d, None) for d, _ in entries["dirs"]]
+            # 旧版索引的文件记录末尾带有ino, 忽略
+            return dirs, [FileRecord(path, *f[:3]) for f in entries["files"]]
+        entries = {"dirs": [], "files": []}
+        with os.scandir(path) as scanner:
+            for i in scanner:
+                # Windows下DirEntry.stat()无需额外网络请求
+                if i.is_dir():
+                    entries["dirs"].append([i.path, i.stat().st_mtime])
+                elif is_qcfile(i.name):
+                    st = i.stat()
+                    entries["files"].append([i.name, st.st_size, st.st_mtime])
+        self.dirs[path] = (mtime, entries)
+        self.changed.add(path)
+        return entries["dirs"], [FileRecord(path, *f) for f in entries["files"]]
+
+    def save(self):
+        '''保存索引, 删除本次未访问的目录'''
+        stale = [p for p in self.dirs if p not in self.visited]
+        rows = [
+            (p, self.dirs[p][0], json.dumps(self.dirs[p][1], ensure_ascii=False))
+            for p in self.changed
+        ]
+        with LOCALDB.atomic():
+            for batch in chunked(stale, 100):
+                ScanDir.delete().where(ScanDir.path.in_(batch)).execute()
+            for batch in chunked(rows, 100):
+                ScanDir.insert_many(
+                    batch,
+                    fields=[ScanDir.path, ScanDir.mtime, ScanDir.entries]
+                ).on_conflict_replace().execute()
+        for p in stale:
+            del self.dirs[p]
+        self.visited.clear()
+        self.changed.clear()
+
+
+def walk(roots: list[str], index: DirIndex, workers: int = 8):
+    '''
+    多根目录并行扫描, 有界线程池逐目录列举
+
+    Args:
+        - `roots`: 根目录列表
+        - `index`: 目录索引
+        - `workers`: 线程数
+
+    Yields:
+        - tuple[str, list[FileRecord]]: 每个目录完成时产出`(root, files)`
+    '''
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = {
+        pool.submit(index.listdir, root): root
+        for root in roots
+    }
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                root = pending.pop(future)
+                dirs, files = future.result()
+                for d, mtime in dirs:
+                    pending[pool.submit(index.listdir, d, mtime)] = root
+                yield root, files
+    finally:
+        # 异常或提前退出时取消未开始的列举任务
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def awalk(roots: list[str], index: DirIndex, workers: int = 8, timeout: float = 10.0):
+    '''
+    异步流式扫描, 边扫描边产出文件, 扫描完成后保存索引
+
+    Args:
+        - `timeout`: 相邻两个目录完成之间的最长等待时间(s)
+
+    Yields:
+        - tuple[str, FileRecord]: `(root, file)`
+    '''
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in walk(roots, index, workers):
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            WRITER.call(index.save)
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await asyncio.wait_for(queue.get(), timeout=timeout)
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            root, files = item
+            for f in files:
+                yield root, f
+    finally:
+        stop.set()
@@ -0,0 +1,120 @@
+import re
+
+from Autoseek.database import READDB, reads
+from .model import SDS, SEC, LAL, PidSearch
+
+
+# 范围: P90000-P90500, P90000–P90500, P90000~P90500, P90000~90500, P90000–90500
+# "-"后省略前缀时与带后缀pid(P90001-2)冲突, 不视为范围
+RANGE = re.compile(r"^([A-Za-z]*)(\d+)(?:[-–~～]\1|[–~～])(\d+)$")
+# 单个范围最多展开的pid数
+RANGE_LIMIT = 1000
+
+
+def parse_range(text: str) -> tuple[str, int, int, int] | None:
+    '''
+    解析pid范围
+
+    Returns:
+        - tuple: `(前缀, 起始编号, 结束编号, 编号位数)`, 非范围时为None
+    '''
+    match = RANGE.match(text.strip())
+    if match is None:
+        return None
+    prefix, lo, hi = match.groups()
+    if int(hi) < int(lo):
+        return None
+    return prefix, int(lo), int(hi), len(lo)
+
+
+@reads
+def expand_range(text: str, limit: int = RANGE_LIMIT) -> list[str]:
+    '''
+    查询范围内已有检测结果的pid, 含带后缀的pid(如P90001-2)
+
+    利用pid索引按字符串区间查询, 再按编号过滤。
+    '''
+    rng = parse_range(text)
+    if rng is None:
+        return []
+    prefix, lo, hi, width = rng
+    start = f"{prefix}{lo:0{width}d}"
+    # 后缀字符均小于"~", 结束编号的带后缀pid包含在区间内
+    end = f"{prefix}{hi:0{width}d}~"
+    pattern = re.compile(rf"^{re.escape(prefix)}(\d+)")
+    pids = set()
+    for model in (SDS, SEC, LAL):
+        query = model.select(model.pid).where(
+            (model.pid >= start) & (model.pid <= end)
+        ).distinct().tuples().bind(READDB)
+        for pid, in query:
+            match = pattern.match(pid)
+            if match and lo <= int(match.group(1)) <= hi:
+                pids.add(pid)
+    return sorted(pids)[:limit]
+
+
+def _phrase(text: str) -> str:
+    '''FTS5短语, 转义双引号'''
+    return '"{}"'.format(text.replace('"', '""'))
+
+
+@reads
+def prefix(text: str, limit: int = 20) -> list[str]:
+    '''按pid索引查询前缀, 输入不区分大小写时同时查询大写形式'''
+    pids = set()
+    for head in dict.fromkeys([text, text.upper()]):
+        for model in (SDS, SEC, LAL):
+            query = model.select(model.pid).where(
+                (model.pid >= head) & (model.pid < head + "\U0010ffff")
+            ).distinct().order_by(model.pid).limit(limit).tuples().bind(READDB)
+            pids.update(pid for pid, in query)
+    return sorted(pids)[:limit]
+
+
+@reads
+def _match(query: str, limit: int) -> list[str]:
+    '''全文查询前`limit`个候选pid, 保持顺序去重; 不排序, 命中行再多也只读取`limit`行'''
+    rows = PidSearch.select(PidSearch.pid).where(
+        PidSearch.match(query)
+    ).limit(limit).tuples().bind(READDB)
+    return list(dict.fromkeys(pid for pid, in rows))
+
+
+@reads
+def suggest(text: str, limit: int = 20, candidates: int = 500) -> list[str]:
+    '''
+    输入联想, 按相关度返回pid
+
+    依次为范围、pid前缀(走pid索引)、pid子串、来源文件名子串, 均无结果时按trigram模糊匹配;
+    不区分大小写, 至少3个字符。子串查询只取前`candidates`个候选,
+    宽泛输入(如"SEC"命中全部文件名)不会对全部命中行分组排序。
+    '''
+    text = text.strip()
+    if parse_range(text):
+        return expand_range(text, limit)
+    if len(text) < 3:
+        return []
+    pids = prefix(text, limit)
+    phrase = _phrase(text)
+    lower = text.lower()
+    for column in ("pid", "name"):
+        if len(pids) >= limit:
+            break
+        found = _match(f"{column} : {phrase}", candidates)
+        # pid子串中前缀匹配优先
+        found.sort(key=lambda pid: (not pid.lower().startswith(lower), pid))
+        pids += [pid for pid in found if pid not in pids]
+    if not pids:
+        # 模糊: 任一trigram命中即可, bm25排序, 共有trigram越多越靠前
+        grams = {text[i:i+3] for i in range(len(text) - 2)}
+        terms = " OR ".join(_phrase(g) for g in grams)
+        query = PidSearch.select(PidSearch.pid).where(
+            PidSearch.match(f"pid : ({terms})")
+        ).order_by(PidSearch.rank()).limit(limit * 10)
+        for pid, in query.tuples().bind(READDB):
+            if pid not in pids:
+                pids.append(pid)
+                if len(pids) >= limit:
+                    break
+    return pids[:limit]
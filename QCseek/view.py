@@ -1,77 +1,75 @@
-import os
-import shutil
+import re
 import asyncio
 from pathlib import Path
-from datetime import datetime
 
 import cv2
 import fitz
 import numpy as np
 import pandas as pd
+from peewee import JOIN, fn, chunked
 
 from Autoseek.settings import BASE_DIR, CONFIG, WHITE, LOCALDB
+from Autoseek.database import READDB, WRITER, reads, backup as backup_db
 from .sds_reader import pre_cut, gel_crop
+from .scanner import FileRecord, DirIndex, awalk
+from .planner import ChangeSet, ChangePlanner
+from .ingest import CreateError, IngestScheduler
 from .model import *
 
 
-def scan(dir):
-    '''扫描文件夹, 返回PPTX, PDF列表'''
-    res = []
-    with os.scandir(dir) as scanner:
-        for i in scanner:
-            if i.is_dir():
-                res += scan(i)
-            # 排除白名单文件和Windows临时文件
-            elif (i.name not in WHITE) and (not i.name.startswith("~$")):
-                name = i.name.lower()
-                if name.endswith("pptx") or name.endswith("pdf"):
-                    folder = i.path.replace(i.name, "")[:-1]
-                    res.append((folder, i.name))
-    return res
-
-
-def search_source():
-    # 读取配置
+def source_roots() -> dict:
+    '''读取配置, 返回`{根目录: 模型}`, 自定义源模型为None'''
     qcconfig = CONFIG["QCSEEK"]
     default_source = qcconfig["DefaultSource"]
     custom_source = qcconfig["CustomSource"]
     # 默认源
-    sds_files = scan(Path(default_source) / "SDS-PAGE")
-    sec_files = scan(Path(default_source) / "SEC")
-    lal_files = scan(Path(default_source) / "LAL")
+    roots = {
+        str(Path(default_source) / "SDS-PAGE"): SDS,
+        str(Path(default_source) / "SEC"): SEC,
+        str(Path(default_source) / "LAL"): LAL,
+    }
     # 自定义源
     if custom_source:
-        for path, name in scan(custom_source):
-            if "SDS-PAGE" in name:
-                sds_files.append((path, name))
-            elif "SEC" in name:
-                sec_files.append((path, name))
-            elif "LAL" in name:
-                lal_files.append((path, name))
-    return sds_files, sec_files, lal_files
+        roots.setdefault(custom_source, None)
+    return roots
 
 
-async def create_qcfile(path: str, name: str) -> QCFile | None:
+def classify(model, name: str):
+    '''根据根目录模型或文件名判断文件类型'''
+    if model is not None:
+        return model
+    if "SDS-PAGE" in name:
+        return SDS
+    elif "SEC" in name:
+        return SEC
+    elif "LAL" in name:
+        return LAL
+    return None
+
+
+def create_qcfile(file: FileRecord) -> QCFile | None:
     '''
-    从文件创建`QCFile`实例
+    从扫描记录创建`QCFile`实例, 直接使用扫描时的stat数据
 
     Args:
-        - `path`: 文件路径
-        - `name`: 文件名
+        - `file`: 文件记录
 
     Returns:
         - QCFile | None
     '''
-    mtime = await asyncio.to_thread(os.path.getmtime, Path(path) / name)
-    mtime = datetime.fromtimestamp(mtime)
+    mtime = file.modified
     qcfile, created = QCFile.get_or_create(
-        name=name,
-        defaults={"path": path, "modified": mtime}
+        name=file.name,
+        defaults={
+            "path": file.path,
+            "modified": mtime,
+            "stem": QCFile.make_stem(file.name)
+        }
     )
     if created:
         return qcfile
     elif qcfile.modified < mtime:
-        qcfile.path = path
+        qcfile.path = file.path
         qcfile.modified = mtime
         qcfile.save()
         return qcfile
@@ -79,47 +77,35 @@ async def create_qcfile(path: str, name: str) -> QCFile | None:
         return None
 
 
-class CreateError(Exception):
-    '''模型创建异常'''
-
-    def __init__(self, qcfile: QCFile | None, path: str, name: str, msg: str):
-        super().__init__(msg)
-        self.qcfile = qcfile
-        self.path = path
-        self.name = name
-
-
-async def create_ssl(path: str, name: str, model) -> list[BaseModel]:
+async def create_ssl(file: FileRecord, model) -> list[tuple[tuple, int]]:
     '''
-    从文件批量创建SDS/SEC/LAL实例
+    从文件批量解析SDS/SEC/LAL行
 
     Args:
-        - `path`: 文件路径
-        - `name`: 文件名
+        - `file`: 文件记录
         - `model`: 创建模型类型
 
     Returns:
-        - list[BaseModel]: 待保存模型实例列表
+        - list[tuple]: 待保存的`(行元组, 来源文件id)`列表
     '''
     try:
         qcfile = None
-        qcfile = await create_qcfile(path, name)
+        qcfile = create_qcfile(file)
         if qcfile is None:
             return []
         else:
             updating = await model.from_qcfile(qcfile)
             return updating
     except Exception as e:
-        raise CreateError(qcfile, path, name, str(e))
+        raise CreateError(qcfile, file.path, file.name, str(e))
 
 
-async def attach_pdf(path: str, name: str):
+async def attach_pdf(file: FileRecord):
     '''
     从文件添加SEC模型attach
 
     Args:
-        - `path`: 文件路径
-        - `name`: 文件名
+        - `file`: 文件记录
 
     Returns:
         - list[BaseModel]: 待更新SEC实例列表
@@ -127,92 +113,140 @@ async def attach_pdf(path: str, name: str):
     '''
     try:
         qcfile = None
-        qcfile = await create_qcfile(path, name)
+        qcfile = create_qcfile(file)
         if qcfile is None:
             return []
         else:
             return SEC.add_attach(qcfile)
     except Exception as e:
-        raise CreateError(qcfile, path, name, str(e))
-
-
-def backup():
-    '''备份数据库'''
-    shutil.copy(BASE_DIR / "sqlite.db",  BASE_DIR / "sqlite_bak.db")
-
-
-async def batch_create_ssl(file_list, model, dialog):
-    '''从文件列表批量创建SDS/SEC/LAL'''
-    tasks = []
-    for path, name in file_list:
-        if name.lower().endswith("pptx"):
-            task = asyncio.create_task(create_ssl(path, name, model))
-            task.add_done_callback(lambda t: dialog.step.emit())
-            tasks.append(task)
-    res = await asyncio.gather(*tasks, return_exceptions=True)
-    updating, failed, errors = [], [], []
-    for r in res:
-        if isinstance(r, CreateError):
-            errors.append({
-                "path": r.path,
-                "name": r.name,
-                "error": str(r)
-            })
-            if r.qcfile is not None:
-                failed.append(r.qcfile)
-        else:
-            updating += r
-    # 更新数据库
+        raise CreateError(qcfile, file.path, file.name, str(e))
+
+
+def backup() -> Path:
+    '''在线备份数据库, 保留最近`BackupKeep`份'''
+    keep = CONFIG.getint("QCSEEK", "BackupKeep", fallback=5)
+    return backup_db(LOCALDB, BASE_DIR / "backup", keep)
+
+
+def batch_attach_pdf(qcfiles: list[QCFile], dialog):
+    '''批量添加SEC模型attach, 内存中一次匹配全部PDF'''
+    matched, issues, unmatched = SEC.match_attach(qcfiles)
+    errors = [
+        {"path": qcfile.path, "name": qcfile.name, "error": msg}
+        for qcfile, msg in issues
+    ]
+    # 更新数据库, 无匹配PPT的PDF删除以便下次重试; 歧义PDF保留, 其余匹配照常添加
     with LOCALDB.atomic():
-        model.bulk_create(updating, batch_size=100)
-        for i in failed:
-            i.delete_instance()
+        SEC.bulk_attach(matched)
+        failed = [qcfile.id for qcfile in unmatched if qcfile.id is not None]
+        for batch in chunked(failed, 100):
+            # 已添加附件的PDF重新匹配失败时先解除引用
+            SEC.update(attach=None).where(SEC.attach.in_(batch)).execute()
+            QCFile.delete().where(QCFile.id.in_(batch)).execute()
+    for _ in qcfiles:
+        dialog.step.emit()
     return errors
 
 
-async def batch_attach_pdf(file_list, dialog):
-    '''从文件列表批量添加SEC模型attach'''
-    tasks = []
-    for path, name in file_list:
-        if name.lower().endswith("pdf"):
-            task = asyncio.create_task(attach_pdf(path, name))
-            task.add_done_callback(lambda t: dialog.step.emit())
-            tasks.append(task)
-    res = await asyncio.gather(*tasks, return_exceptions=True)
-    updating, failed, errors = [], [], []
-    for r in res:
-        if isinstance(r, CreateError):
-            errors.append({
-                "path": r.path,
-                "name": r.name,
-                "error": str(r)
-            })
-            if r.qcfile is not None:
-                failed.append(r.qcfile)
-        else:
-            updating += r
-    # 更新数据库
+def related_pdfs(decks: list[QCFile], exclude: list[QCFile]) -> list[QCFile]:
+    '''
+    已入库、本次未修改但与本次解析的SEC PPT相关的PDF
+
+    重新出现或修改的PPT重新解析后附件为空, 其PDF未变化不会再次扫描, 需重新匹配。
+    匹配规则同`SEC.match_attach`: stem相同或PDF文件名包含于PPT文件名。
+
+    Args:
+        - `decks`: 本次解析的SEC PPT文件
+        - `exclude`: 本次已扫描到的PDF文件
+    '''
+    if not decks:
+        return []
+    stems = {QCFile.make_stem(d.name) for d in decks}
+    names = [d.name for d in decks]
+    skip = {f.name for f in exclude}
+    query = QCFile.select().join(Tombstone, JOIN.LEFT_OUTER).where(
+        QCFile.name.endswith(".pdf") & Tombstone.id.is_null()
+    )
+    return [
+        pdf for pdf in query
+        if pdf.name not in skip and (
+            QCFile.make_stem(pdf.name) in stems
+            or any(pdf.name[:-4] in n for n in names)
+        )
+    ]
+
+
+def commit_changes(changes: ChangeSet, results: dict) -> list[dict]:
+    '''
+    在一个事务中写入文件变更及解析结果
+
+    Args:
+        - `changes`: 文件变更
+        - `results`: `IngestScheduler.join`结果
+
+    Returns:
+        - list[dict]: 错误字典列表
+    '''
+    errors = []
     with LOCALDB.atomic():
-        SEC.bulk_update(updating, fields=["attach"], batch_size=100)
-        for i in failed:
-            i.delete_instance()
+        for _, failed, errs in results.values():
+            for i in failed:
+                changes.discard(i)
+            errors += errs
+        changes.apply()
+        changes.reconcile()
+        for model, (updating, _, _) in results.items():
+            # 来源文件id在apply后才分配, 此时再与行元组组合
+            # 同一文件内的重复行由自然键唯一索引忽略
+            model.insert_ignore([(row, src.id) for src, rows in updating for row in rows])
     return errors
 
 
 async def scan_update(dialog):
-    '''扫描文件夹并更新数据库'''
-    connect = asyncio.to_thread(search_source)
-    # 扫描F盘，超时10s
-    sds_files, sec_files, lal_files = await asyncio.wait_for(connect, timeout=10.0)
-    dialog.started.emit(len(sds_files)+len(sec_files) +
-                        len(lal_files), "更新数据库...")
-    errors = await asyncio.gather(
-        batch_create_ssl(sds_files, SDS, dialog),
-        batch_create_ssl(sec_files, SEC, dialog),
-        batch_create_ssl(lal_files, LAL, dialog)
-    )
-    errors.append(await batch_attach_pdf(sec_files, dialog))
-    errors = sum(errors, [])
+    '''扫描文件夹并更新数据库, 边扫描边解析'''
+    roots = source_roots()
+    workers = CONFIG.getint("QCSEEK", "ScanWorkers", fallback=8)
+    # 关闭目录索引时每次完整列举, 可发现原位覆盖的文件
+    if CONFIG.getboolean("QCSEEK", "DirIndex", fallback=True):
+        index = await asyncio.to_thread(DirIndex.load)
+    else:
+        index = DirIndex()
+    planner = ChangePlanner.load()
+    scheduler = IngestScheduler.from_config(dialog, "更新数据库...")
+    pdf_files, sec_decks = [], []
+    total = 0
+    dialog.started.emit(total, "更新数据库...")
+    # 扫描F盘，相邻目录间超时10s
+    try:
+        async for root, file in awalk(list(roots), index, workers):
+            model = classify(roots[root], file.name)
+            if model is None or file.name in WHITE:
+                continue
+            is_pptx = file.name.lower().endswith("pptx")
+            if not (is_pptx or model is SEC):
+                continue
+            # 内存比对, 仅新增或已修改文件需要解析
+            qcfile = planner.feed(file)
+            if qcfile is None:
+                continue
+            total += 1
+            dialog.maximumChange.emit(total)
+            if is_pptx:
+                # 在途任务已满时等待, 形成背压
+                await scheduler.submit(qcfile, model)
+                if model is SEC:
+                    sec_decks.append(qcfile)
+            else:
+                pdf_files.append(qcfile)
+        changes = planner.finish()
+        results = await scheduler.join()
+    finally:
+        scheduler.close()
+    # 更新数据库, 在写线程中执行
+    errors = await WRITER.run(commit_changes, changes, results)
+    related = await WRITER.run(related_pdfs, sec_decks, pdf_files)
+    dialog.maximumChange.emit(total + len(related))
+    errors += await WRITER.run(batch_attach_pdf, pdf_files + related, dialog)
     # 输出错误文件
     pd.DataFrame(
         errors,
@@ -220,49 +254,127 @@ async def scan_update(dialog):
     ).to_excel(BASE_DIR / "out/errors.xlsx", index=False)
 
 
-async def clean(model):
-    '''清洗数据库，删除重复项'''
-    deleting = set()
-    query_all = model.select()
-    for item in query_all:
-        query = None
-        if model == SDS:
-            query = model.select().where(
-                model.pid == item.pid,
-                model.purity == item.purity,
-                model.source == item.source,
-                model.pic == item.pic,
-                model.non_reduced_lane == item.non_reduced_lane,
-                model.reduced_lane == item.reduced_lane
-            )
-        elif model == SEC:
-            query = model.select().where(
-                model.pid == item.pid,
-                model.retention_time == item.retention_time,
-                model.hmw == item.hmw,
-                model.monomer == item.monomer,
-                model.lmw == item.lmw,
-                model.source == item.source,
-                model.attach == item.attach,
-                model.pic_num == item.pic_num
-            )
-        elif model == LAL:
-            query = model.select().where(
-                model.pid == item.pid,
-                model.value == item.value,
-                model.source == item.source
-            )
-        if len(query) > 1:
-            i_set = [i.id for i in query]
-            i_set.remove(min(i_set))
-            deleting.update(i_set)
-    backup()
-    with LOCALDB.atomic():
-        for d in deleting:
-            model.get(model.id == d).delete_instance()
+def parse_pids(text: str) -> list[str]:
+    '''从粘贴或导入文本中提取蛋白编号, 去重并保持顺序'''
+    pids = re.split(r"[\s,，;；、]+", text)
+    return list(dict.fromkeys(i for i in pids if i))
+
+
+@reads
+def select_results(model, where) -> list:
+    '''
+    只读查询检测结果, 连接来源文件(SEC另连接附件), 不创建模型实例
+
+    Args:
+        - `model`: SDS/SEC/LAL
+        - `where`: 查询条件
+
+    Returns:
+        - list: `SDSResult`/`SECResult`/`LALResult`列表
+    '''
+    files = (QCFile.id, QCFile.path, QCFile.name, QCFile.modified)
+    if model is SDS:
+        query = SDS.select(
+            SDS.id, SDS.pid, SDS.purity, SDS.pic,
+            SDS.non_reduced_lane, SDS.reduced_lane, *files
+        ).join(QCFile)
+        convert = lambda row: SDSResult(*row[:6], FileRef(*row[6:]))
+    elif model is SEC:
+        attach = QCFile.alias()
+        query = SEC.select(
+            SEC.id, SEC.pid, SEC.retention_time, SEC.hmw, SEC.monomer, SEC.lmw,
+            SEC.pic_num, *files, attach.id, attach.path, attach.name, attach.modified
+        ).join(
+            QCFile, on=(SEC.source == QCFile.id)
+        ).switch(SEC).join(
+            attach, JOIN.LEFT_OUTER, on=(SEC.attach == attach.id)
+        )
+        # 无附件时左连接字段全为NULL
+        convert = lambda row: SECResult(
+            *row[:7], FileRef(*row[7:11]),
+            FileRef(*row[11:]) if row[11] is not None else None
+        )
+    else:
+        query = LAL.select(LAL.id, LAL.pid, LAL.value, *files).join(QCFile)
+        convert = lambda row: LALResult(*row[:3], FileRef(*row[3:]))
+    return [convert(row) for row in query.where(where).tuples().bind(READDB)]
+
 
+@reads
+def find_qc(pids: list[str]) -> dict[str, tuple[list, list, list]]:
+    '''
+    批量查询检测结果
+
+    每个模型一次`IN`查询并连接来源文件, 使用只读连接;
+    结果为只读元组, 后续弹窗不再查询数据库。
+
+    Args:
+        - `pids`: 蛋白编号列表
 
-async def extract_sds(sds: SDS, folder: str):
+    Returns:
+        - dict: `{pid: (SDSResult列表, SECResult列表, LALResult列表)}`
+    '''
+    results = {pid: ([], [], []) for pid in pids}
+    for batch in chunked(pids, 500):
+        for i, model in enumerate((SDS, SEC, LAL)):
+            for r in select_results(model, model.pid.in_(batch)):
+                results[r.pid][i].append(r)
+    return results
+
+
+@reads
+def load_results(model, ids: list[int]) -> dict:
+    '''按id批量读取检测结果, 返回`{id: 结果元组}`'''
+    results = {}
+    for batch in chunked(list(set(ids)), 500):
+        for r in select_results(model, model.id.in_(batch)):
+            results[r.id] = r
+    return results
+
+
+@reads
+def load_files(ids: list[int]) -> dict[int, FileRef]:
+    '''按id批量读取文件, 返回`{id: FileRef}`'''
+    files = {}
+    for batch in chunked(list(set(ids)), 500):
+        query = QCFile.select(
+            QCFile.id, QCFile.path, QCFile.name, QCFile.modified
+        ).where(QCFile.id.in_(batch)).tuples().bind(READDB)
+        for row in query:
+            files[row[0]] = FileRef(*row)
+    return files
+
+
+def clean(model) -> list[dict]:
+    '''
+    清洗数据库, 删除重复项, 每组保留id最小的一条
+
+    按自然键(`DEDUPE_FIELDS`及来源文件)一次分组查询出重复组, 一条语句删除。
+    迁移后唯一索引已阻止新增重复, 用于检查索引建立前导入或外部写入的数据。
+
+    Args:
+        - `model`: SDS/SEC/LAL
+
+    Returns:
+        - list[dict]: 重复组, 含键字段、来源文件名及删除条数
+    '''
+    fields = [getattr(model, f) for f in model.DEDUPE_FIELDS] + [model.source]
+    count = fn.COUNT(model.id)
+    groups = model.select(
+        *fields, QCFile.name.alias("file"), (count - 1).alias("removed")
+    ).join(QCFile, on=(model.source == QCFile.id)).group_by(
+        *fields
+    ).having(count > 1).dicts()
+    report = list(groups)
+    if report:
+        backup()
+        keep = model.select(fn.MIN(model.id)).group_by(*fields)
+        with LOCALDB.atomic():
+            model.delete().where(model.id.not_in(keep)).execute()
+    return report
+
+
+async def extract_sds(sds: SDSResult, folder: str):
     '''提取SDS图片'''
     async with PPTX(sds.source.shortpathname) as ppt:
         img = await ppt.get_image_by_name(sds.pic)
@@ -280,7 +392,7 @@ async def extract_sds(sds: SDS, folder: str):
         return temp
 
 
-async def extract_sec(sec: SEC, folder: str):
+async def extract_sec(sec: SECResult, folder: str):
     '''提取SEC图片'''
     if sec.attach:
         # 提取PDF
@@ -1,45 +1,66 @@
 import os
 import shutil
 import asyncio
+from typing import NamedTuple
 
-from PyQt6.QtGui import QKeyEvent
-from PyQt6.QtCore import Qt, pyqtSignal, QRect
+import pandas as pd
+from PyQt6.QtGui import QKeyEvent, QKeySequence
+from PyQt6.QtCore import (
+    Qt, pyqtSignal, QRect, QEvent, QTimer, QStringListModel,
+    QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+)
 from PyQt6.QtWidgets import (
-    QTableWidget, QHeaderView, QTableWidgetItem,
+    QTableView, QHeaderView, QLineEdit,
     QAbstractItemView, QStyle, QStyleOptionButton,
     QCheckBox, QWidget, QVBoxLayout, QMessageBox,
-    QFileDialog, QApplication
+    QFileDialog, QApplication, QCompleter
 )
 from qasync import asyncSlot
 
 from Autoseek.dialog import asyncDialog
 from Autoseek.settings import BASE_DIR
+from Autoseek.database import READER, WRITER
 from .dialog import QcresultDialog, SampleDialog, SourceDialog
 from .qc_ui import Ui_Qc
-from .model import SDS, SEC, LAL
+from .model import SDS, SEC, LAL, FileRef, SDSResult, SECResult, LALResult
 from .coa import CoAData, find_by_pid, filter_coa_data
-from .view import scan_update, extract_sds, extract_sec
-
-
-class QcRow:
-    '''QC行数据类'''
-
-    def __init__(self, pid: str, sds: SDS = None, sec: SEC = None, lal: LAL = None):
-        self.pid = pid
-        self.sds = sds
-        self.sec = sec
-        self.lal = lal
+from .search import RANGE_LIMIT, parse_range, expand_range, suggest
+from .view import (
+    scan_update, clean, parse_pids, find_qc,
+    load_results, load_files, extract_sds, extract_sec
+)
 
-    def __str__(self) -> str:
-        return f"QcRow({self.pid}, {self.sds}, {self.sec}, {self.lal})"
 
+class QcRow(NamedTuple):
+    '''
+    QC行数据, 只读
 
-class QcItem(QTableWidgetItem):
-    '''居中单元格'''
+    仅保存显示文本及结果、文件id; 导出、生成CoA时按id读取。
+    '''
+    pid: str
+    purity: str = "N/A"
+    monomer: str = "N/A"
+    lal: str = "N/A"
+    sds_id: int | None = None
+    sec_id: int | None = None
+    lal_id: int | None = None
+    files: tuple[int, ...] = ()  # 来源文件及附件id
 
-    def __init__(self, text: str):
-        super().__init__(text)
-        self.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+    @classmethod
+    def from_results(cls, pid: str, sds: SDSResult = None, sec: SECResult = None, lal: LALResult = None):
+        files = [r.source.id for r in (sds, sec, lal) if r is not None]
+        if sec is not None and sec.attach is not None:
+            files.append(sec.attach.id)
+        return cls(
+            pid,
+            sds.purity if sds else "N/A",
+            sec.monomer if sec else "N/A",
+            lal.value if lal else "N/A",
+            sds.id if sds else None,
+            sec.id if sec else None,
+            lal.id if lal else None,
+            tuple(dict.fromkeys(files)),
+        )
 
 
 class CheckableHeader(QHeaderView):
@@ -67,49 +88,250 @@ class CheckableHeader(QHeaderView):
 
     def mousePressEvent(self, event):
         index = self.logicalIndexAt(event.pos())
-        if index == 0:
+        if index == 0 and event.pos().x() < 23:
             self.checked = not self.checked
             self.allchecked.emit(self.checked)
             self.updateSection(0)
+        else:
+            # 点击其余位置排序
+            super().mousePressEvent(event)
+
+
+class QcTableModel(QAbstractTableModel):
+    '''
+    QC结果表格模型
+
+    按列存储显示文本, 勾选状态为"全局状态+翻转集合",
+    全选/全不选O(1), 批量插入、删除各只发出一次行变更信号。
+    '''
+    HEADERS = ["蛋白编号", "SDS", "SEC", "LAL"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.qcrows: list[QcRow] = []
+        self.columns: list[list[str]] = [[] for _ in self.HEADERS]
+        self._base = False      # 全局勾选状态
+        self._flip = set()      # 与全局状态相反的行
+        self._sort = None       # (列, 顺序)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.qcrows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section: int, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def isChecked(self, row: int) -> bool:
+        return self._base != (row in self._flip)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.columns[index.column()][index.row()]
+        if role == Qt.ItemDataRole.CheckStateRole and index.column() == 0:
+            checked = self.isChecked(index.row())
+            return Qt.CheckState.Checked if checked else Qt.CheckState.Unchecked
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return Qt.AlignmentFlag.AlignCenter
+        return None
+
+    def setData(self, index: QModelIndex, value, role=Qt.ItemDataRole.EditRole) -> bool:
+        if role != Qt.ItemDataRole.CheckStateRole or index.column() != 0:
+            return False
+        checked = Qt.CheckState(value) == Qt.CheckState.Checked
+        if checked != self.isChecked(index.row()):
+            self._flip ^= {index.row()}
+            self.dataChanged.emit(index, index, [role])
+        return True
+
+    def flags(self, index: QModelIndex):
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() == 0:
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+        return flags
+
+    def addRows(self, rows: list[QcRow]):
+        '''批量追加行, 新行未勾选'''
+        if not rows:
+            return
+        start = len(self.qcrows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self.qcrows += rows
+        for column, values in zip(self.columns, zip(*(self.display(r) for r in rows))):
+            column += values
+        if self._base:
+            self._flip.update(range(start, start + len(rows)))
+        self.endInsertRows()
+        if self._sort is not None:
+            self.sort(*self._sort)
+
+    def sort(self, column: int, order=Qt.SortOrder.AscendingOrder):
+        '''按列存储排序, 一次重排全部列'''
+        if column < 0:
+            self._sort = None
+            return
+        self._sort = (column, order)
+        keys = self.columns[column]
+        perm = sorted(
+            range(len(keys)), key=keys.__getitem__,
+            reverse=(order == Qt.SortOrder.DescendingOrder)
+        )
+        self.layoutAboutToBeChanged.emit()
+        self.qcrows = [self.qcrows[i] for i in perm]
+        self.columns = [[c[i] for i in perm] for c in self.columns]
+        new = {old: i for i, old in enumerate(perm)}
+        self._flip = {new[i] for i in self._flip}
+        self.layoutChanged.emit()
+
+    @staticmethod
+    def display(row: QcRow) -> tuple[str, str, str, str]:
+        '''行显示文本'''
+        return row.pid, row.purity, row.monomer, row.lal
+
+    def setAllChecked(self, checked: bool):
+        '''全选/全不选'''
+        self._base = checked
+        self._flip = set()
+        if self.qcrows:
+            self.dataChanged.emit(
+                self.index(0, 0), self.index(len(self.qcrows) - 1, 0),
+                [Qt.ItemDataRole.CheckStateRole]
+            )
+
+    def setChecked(self, rows: list[int], checked: bool):
+        '''勾选/取消勾选指定行'''
+        for row in rows:
+            if self.isChecked(row) != checked:
+                self._flip ^= {row}
+        if rows:
+            self.dataChanged.emit(
+                self.index(min(rows), 0), self.index(max(rows), 0),
+                [Qt.ItemDataRole.CheckStateRole]
+            )
+
+    def checkedRows(self) -> list[int]:
+        '''勾选行号, 升序'''
+        if not self._base:
+            return sorted(self._flip)
+        return [i for i in range(len(self.qcrows)) if i not in self._flip]
+
+    def removeRowsIn(self, rows: list[int]):
+        '''删除指定行, 连续行合并为一次删除'''
+        if not rows:
+            return
+        # 从后往前按连续区间删除, 前面的行号不受影响
+        ranges = []
+        for r in sorted(rows, reverse=True):
+            if ranges and ranges[-1][0] == r + 1:
+                ranges[-1][0] = r
+            else:
+                ranges.append([r, r])
+        for first, last in ranges:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.qcrows[first:last + 1]
+            for column in self.columns:
+                del column[first:last + 1]
+            self.endRemoveRows()
+        # 重新计算翻转集合中的行号
+        removed = set(rows)
+        shift, flip = 0, set()
+        for i in range(max(self._flip, default=-1) + 1):
+            if i in removed:
+                shift += 1
+            elif i in self._flip:
+                flip.add(i - shift)
+        self._flip = flip
+
+
+class QcProxyModel(QSortFilterProxyModel):
+    '''筛选代理, 直接读取列存储判断; 排序交由源模型完成'''
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._text = ""
+
+    def setFilterText(self, text: str):
+        self._text = text.strip().lower()
+        self.invalidateFilter()
+
+    @property
+    def filtering(self) -> bool:
+        return bool(self._text)
+
+    def sourceRows(self) -> list[int]:
+        '''筛选后可见行在源模型中的行号'''
+        return [self.mapToSource(self.index(i, 0)).row() for i in range(self.rowCount())]
+
+    def filterAcceptsRow(self, row: int, parent: QModelIndex) -> bool:
+        if not self._text:
+            return True
+        return any(self._text in c[row].lower() for c in self.sourceModel().columns)
 
+    def sort(self, column: int, order=Qt.SortOrder.AscendingOrder):
+        self.sourceModel().sort(column, order)
+
+
+class QcTable(QTableView):
+    '''QC结果表格, 经代理模型排序、筛选'''
 
-class QcTable(QTableWidget):
     def __init__(self, parent):
         super().__init__(parent)
-        self.qcrows = []
+        self.source = QcTableModel(self)
+        self.proxy = QcProxyModel(self)
+        self.proxy.setSourceModel(self.source)
+        self.setModel(self.proxy)
         self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
-        self.setColumnCount(4)
         self.header = CheckableHeader()
         self.header.allchecked.connect(self.allchecked)
         self.setHorizontalHeader(self.header)
-        self.setHorizontalHeaderLabels(["蛋白编号", "SDS", "SEC", "LAL"])
         self.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.horizontalHeader().setDefaultAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.setSortingEnabled(True)
+        self.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+
+    @property
+    def qcrows(self) -> list[QcRow]:
+        return self.source.qcrows
 
     def addRow(self, row: QcRow):
-        self.qcrows.append(row)
-        endrow = self.rowCount()
-        self.insertRow(endrow)
-        pid = QcItem(row.pid)
-        pid.setCheckState(Qt.CheckState.Unchecked)
-        sds = QcItem(row.sds.purity if row.sds else "N/A")
-        sec = QcItem(row.sec.monomer if row.sec else "N/A")
-        lal = QcItem(row.lal.value if row.lal else "N/A")
-        for i, col in enumerate([pid, sds, sec, lal]):
-            self.setItem(endrow, i, col)
+        self.source.addRows([row])
+
+    def addRows(self, rows: list[QcRow]):
+        self.source.addRows(rows)
+
+    def checkedRows(self) -> list[int]:
+        '''勾选且未被筛选隐藏的行'''
+        rows = self.source.checkedRows()
+        if not self.proxy.filtering:
+            return rows
+        return [i for i in rows if self.proxy.filterAcceptsRow(i, QModelIndex())]
 
     def selections(self) -> list[QcRow]:
-        return [
-            self.qcrows[i]
-            for i in range(self.rowCount())
-            if self.item(i, 0).checkState() == Qt.CheckState.Checked
-        ]
+        return [self.source.qcrows[i] for i in self.checkedRows()]
 
     def allchecked(self, checked):
-        for i in range(self.rowCount()):
-            item = self.item(i, 0)
-            state = Qt.CheckState.Checked if checked else Qt.CheckState.Unchecked
-            item.setCheckState(state)
+        '''全选/全不选, 筛选时只作用于可见行'''
+        if self.proxy.filtering:
+            self.source.setChecked(self.proxy.sourceRows(), checked)
+        else:
+            self.source.setAllChecked(checked)
+
+    def removeChecked(self) -> int:
+        '''删除勾选行, 返回删除行数'''
+        rows = self.checkedRows()
+        self.source.removeRowsIn(rows)
+        return len(rows)
+
+    def filter(self, text: str):
+        '''按任意列包含文本筛选, 不区分大小写; 表头全选状态随之重置'''
+        self.proxy.setFilterText(text)
+        self.header.checked = False
+        self.header.updateSection(0)
 
 
 class QcWidget(QWidget, Ui_Qc):
@@ -117,13 +339,32 @@ class QcWidget(QWidget, Ui_Qc):
         super().__init__(parent)
         self.setupUi(self)
         self.horizontalLayout_4 = QVBoxLayout(self.frame_3)
+        self.filterEdit = QLineEdit(self.frame_3)
+        self.filterEdit.setPlaceholderText("筛选")
+        self.filterEdit.setClearButtonEnabled(True)
+        self.horizontalLayout_4.addWidget(self.filterEdit)
         self.table = QcTable(self.frame_3)
         self.horizontalLayout_4.addWidget(self.table)
+        self.filterEdit.textChanged.connect(self.table.filter)
         # 信号-槽连接
         self.updateButton.clicked.connect(self.update_db)
         self.cleanButton.clicked.connect(self.clean_db)
         self.folderButton.clicked.connect(lambda: SourceDialog(self).show())
         self.searchButton.clicked.connect(self.search)
+        self.importButton.clicked.connect(self.import_pids)
+        self.searchEdit.installEventFilter(self)
+        # 输入联想, 停止输入150ms后查询
+        self.completer = QCompleter(self)
+        self.completer.setModel(QStringListModel(self.completer))
+        self.completer.setWidget(self.searchEdit)
+        self.completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.completer.activated.connect(self.complete_pid)
+        self.suggestSeq = 0
+        self.suggestTimer = QTimer(self)
+        self.suggestTimer.setSingleShot(True)
+        self.suggestTimer.setInterval(150)
+        self.suggestTimer.timeout.connect(self.suggest_pids)
+        self.searchEdit.textEdited.connect(lambda _: self.suggestTimer.start())
         self.exportButton.clicked.connect(self.export_rows)
         self.deleteButton.clicked.connect(self.delete)
         self.coaButton.clicked.connect(self.coa_generate)
@@ -146,59 +387,156 @@ class QcWidget(QWidget, Ui_Qc):
 
     @asyncSlot()
     async def clean_db(self):
-        '''数据库清洗--异步peewee'''
-        # TODO
-        QMessageBox.information(self, "提示", "暂未开发")
-
-    def search(self):
-        '''根据输入框pid搜索并插入数据'''
-        pid = self.searchEdit.text().strip()
-        sds_query = SDS.select().where(SDS.pid == pid)
-        sec_query = SEC.select().where(SEC.pid == pid)
-        lal_query = LAL.select().where(LAL.pid == pid)
-        if not any([sds_query, sec_query, lal_query]):
-            QMessageBox.critical(self, "错误", "暂无检测结果")
-        # 多个检测值
-        elif len(sds_query) > 1 or len(sec_query) > 1 or len(lal_query) > 1:
-            sds_list = [i for i in sds_query]
-            sec_list = [i for i in sec_query]
-            lal_list = [i for i in lal_query]
-            qc_dialog = QcresultDialog(self, pid, sds_list, sec_list, lal_list)
+        '''数据库清洗, 删除重复项并输出清洗报告'''
+        task_dialog = asyncDialog(self)
+        task_dialog.started.emit(3, "清洗数据库...")
+        report = []
+        try:
+            for model in (SDS, SEC, LAL):
+                removed = await WRITER.run(clean, model)
+                report += [{"model": model.__name__, **i} for i in removed]
+                task_dialog.step.emit()
+            task_dialog.finished.emit()
+        except Exception as e:
+            task_dialog.finished.emit()
+            QMessageBox.critical(self, "错误", f"{type(e).__name__}({e})")
+            return
+        if not report:
+            QMessageBox.information(self, "提示", "没有重复数据")
+            return
+        out = BASE_DIR / "out/clean.xlsx"
+        pd.DataFrame(report).to_excel(out, index=False)
+        removed = {}
+        for i in report:
+            removed[i["model"]] = removed.get(i["model"], 0) + i["removed"]
+        summary = ", ".join(f"{k}: {v}" for k, v in removed.items())
+        QMessageBox.information(self, "提示", f"已删除重复数据 {summary}\n详见{out}")
+
+    @asyncSlot()
+    async def search(self):
+        '''根据输入框pid搜索并插入数据, 支持粘贴多个pid及pid范围'''
+        self.suggestTimer.stop()
+        self.suggestSeq += 1
+        self.completer.popup().hide()
+        pids, truncated = [], []
+        for token in parse_pids(self.searchEdit.text()):
+            if not parse_range(token):
+                pids.append(token)
+                continue
+            # 多取一个以判断是否截断
+            found = await READER.run(expand_range, token, RANGE_LIMIT + 1)
+            if len(found) > RANGE_LIMIT:
+                truncated.append(token)
+            pids += found[:RANGE_LIMIT]
+        if truncated:
+            QMessageBox.warning(
+                self, "提示",
+                f"以下范围内结果超过{RANGE_LIMIT}个, 仅查询前{RANGE_LIMIT}个: {', '.join(truncated)}"
+            )
+        await self.search_pids(list(dict.fromkeys(pids)))
+
+    @asyncSlot()
+    async def suggest_pids(self):
+        '''以输入框最后一个pid查询联想结果, 查询在读线程中执行, 不阻塞界面'''
+        self.suggestSeq += 1
+        seq = self.suggestSeq
+        text = self.searchEdit.text()
+        tokens = parse_pids(text)
+        pids = []
+        if tokens and not text[-1].isspace():
+            pids = await READER.run(suggest, tokens[-1])
+        # 查询期间已重新输入或已搜索, 结果作废
+        if seq != self.suggestSeq:
+            return
+        self.completer.model().setStringList(pids)
+        if pids:
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
+    def complete_pid(self, pid: str):
+        '''选中联想结果, 替换输入框最后一个pid'''
+        text = self.searchEdit.text()
+        tokens = parse_pids(text)
+        if tokens:
+            text = text[:text.rfind(tokens[-1])]
+        self.searchEdit.setText(text + pid)
+
+    @asyncSlot()
+    async def import_pids(self):
+        '''从文本或EXCEL文件导入pid并搜索'''
+        path, _ = QFileDialog.getOpenFileName(
+            self, "导入蛋白编号", "", "蛋白编号 (*.txt *.csv *.xlsx)")
+        if not path:
+            return
+        try:
+            if path.lower().endswith("xlsx"):
+                df = pd.read_excel(path, header=None, dtype=str)
+                text = "\n".join(df.iloc[:, 0].dropna())
+            else:
+                with open(path, encoding="utf-8-sig") as f:
+                    text = f.read()
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"{type(e).__name__}({e})")
+            return
+        await self.search_pids(parse_pids(text))
+
+    async def search_pids(self, pids: list[str]):
+        '''批量搜索, 唯一结果一次插入表格, 多个检测值的pid逐个弹窗选择; 查询在读线程中执行'''
+        if not pids:
+            return
+        results = await READER.run(find_qc, pids)
+        rows, ambiguous, missing = [], [], []
+        for pid in pids:
+            sds_list, sec_list, lal_list = results[pid]
+            if not (sds_list or sec_list or lal_list):
+                missing.append(pid)
+            # 多个检测值
+            elif len(sds_list) > 1 or len(sec_list) > 1 or len(lal_list) > 1:
+                ambiguous.append(pid)
+            # 单一检测值
+            else:
+                rows.append(QcRow.from_results(
+                    pid,
+                    sds_list[0] if sds_list else None,
+                    sec_list[0] if sec_list else None,
+                    lal_list[0] if lal_list else None
+                ))
+        self.table.addRows(rows)
+        for pid in ambiguous:
+            qc_dialog = QcresultDialog(self, pid, *results[pid])
             if qc_dialog.exec():
                 sds, sec, lal = qc_dialog.get_data()
-                self.table.addRow(QcRow(pid, sds, sec, lal))
-        # 单一检测值
-        else:
-            sds = sds_query.get() if sds_query else None
-            sec = sec_query.get() if sec_query else None
-            lal = lal_query.get() if lal_query else None
-            self.table.addRow(QcRow(pid, sds, sec, lal))
+                self.table.addRow(QcRow.from_results(pid, sds, sec, lal))
+        if missing:
+            msg = f"暂无检测结果: {', '.join(missing)}"
+            # 少量未命中时给出相近pid
+            if len(missing) <= 5:
+                hints = []
+                for pid in missing:
+                    if s := await READER.run(suggest, pid, 5):
+                        hints.append(f"{pid} → {', '.join(s)}")
+                if hints:
+                    msg += "\n\n相近编号:\n" + "\n".join(hints)
+            QMessageBox.critical(self, "错误", msg)
+
+    def eventFilter(self, obj, event) -> bool:
+        '''输入框粘贴多行文本时以空格连接, 避免只保留第一行'''
+        if (obj is self.searchEdit and event.type() == QEvent.Type.KeyPress
+                and event.matches(QKeySequence.StandardKey.Paste)):
+            text = QApplication.clipboard().text()
+            self.searchEdit.insert(" ".join(parse_pids(text)))
+            return True
+        return super().eventFilter(obj, event)
 
     def delete(self):
         '''删除选中行'''
-        rows = []
-        for i in range(self.table.rowCount()):
-            item = self.table.item(i, 0)
-            if item.checkState() == Qt.CheckState.Checked:
-                rows.append(i)
-        if not rows:
+        if not self.table.removeChecked():
             QMessageBox.critical(self, "错误", "未选择数据")
-        else:
-            for i in reversed(rows):
-                self.table.removeRow(i)
-                self.table.qcrows.pop(i)
-
-    async def export_row(self, row: QcRow, folder: str):
-        '''导出单行数据'''
-        files = []
-        if row.sds:
-            files.append(row.sds.source.shortpathname)
-        if row.sec:
-            files.append(row.sec.source.shortpathname)
-            if row.sec.attach:
-                files.append(row.sec.attach.shortpathname)
-        if row.lal:
-            files.append(row.lal.source.shortpathname)
+
+    async def export_row(self, row: QcRow, folder: str, files: dict[int, FileRef]):
+        '''导出单行数据, `files`为预先读取的`{id: FileRef}`'''
+        files = [files[i].shortpathname for i in row.files if i in files]
         dst = f"{folder}/{row.pid}"
         if not os.path.exists(dst):
             os.mkdir(dst)
@@ -218,9 +556,10 @@ class QcWidget(QWidget, Ui_Qc):
             if not folder:
                 raise NotADirectoryError("错误路径")
             task_dialog.started.emit(len(select), "导出数据...")
+            files = load_files([i for row in select for i in row.files])
             tasks = []
             for row in select:
-                task = asyncio.create_task(self.export_row(row, folder))
+                task = asyncio.create_task(self.export_row(row, folder, files))
                 task.add_done_callback(lambda t: task_dialog.step.emit())
                 tasks.append(task)
             # 设置超时300s
@@ -230,19 +569,20 @@ class QcWidget(QWidget, Ui_Qc):
             task_dialog.finished.emit()
             QMessageBox.critical(self, "错误", f"{type(e).__name__}({e})")
 
-    async def coa_single_generate(self, coa_data: tuple, row: QcRow, folder: str):
+    async def coa_single_generate(self, coa_data: tuple, row: QcRow, folder: str,
+                                  sds: SDSResult | None, sec: SECResult | None):
         coa = CoAData.from_dbdata(coa_data)
         dst = f"{folder}/{row.pid}"
         if not os.path.exists(dst):
             os.mkdir(dst)
         # 提取SDS/SEC图
         tasks = []
-        if row.sds is not None:
-            coa.conclude_sds(row.sds)
-            tasks.append(extract_sds(row.sds, dst))
-        if row.sec is not None:
-            coa.conclude_sec(row.sec)
-            tasks.append(extract_sec(row.sec, dst))
+        if sds is not None:
+            coa.conclude_sds(sds)
+            tasks.append(extract_sds(sds, dst))
+        if sec is not None:
+            coa.conclude_sec(sec)
+            tasks.append(extract_sec(sec, dst))
         # 生成CoA html文件
         # coa.conclude_elisa()
         html = coa.toHtml()
@@ -267,10 +607,12 @@ class QcWidget(QWidget, Ui_Qc):
             return
         task_dialog.started.emit(len(select), "生成CoA...")
         coa_data_list = sample_dialog.get_data()
+        sds = load_results(SDS, [i.sds_id for i in select if i.sds_id is not None])
+        sec = load_results(SEC, [i.sec_id for i in select if i.sec_id is not None])
         tasks = []
         for coa_data, row in zip(coa_data_list, select):
-            task = asyncio.create_task(
-                self.coa_single_generate(coa_data, row,  BASE_DIR / "out"))
+            task = asyncio.create_task(self.coa_single_generate(
+                coa_data, row, BASE_DIR / "out", sds.get(row.sds_id), sec.get(row.sec_id)))
             task.add_done_callback(
                 lambda t: task_dialog.step.emit())
             tasks.append(task)
@@ -5,6 +5,8 @@ import asyncio
 from qasync import QApplication, QEventLoop
 
 from Autoseek.window import BaseWindow
+from Autoseek.database import WRITER, init_readers
+from QCseek.migrations import migrate
 
 
 class Autoseek(QApplication):
@@ -12,6 +14,9 @@ class Autoseek(QApplication):
         super().__init__([])
         self.loop = QEventLoop(self)
         asyncio.set_event_loop(self.loop)
+        # 数据库迁移, 替代各模块导入时建表
+        WRITER.call(migrate)
+        init_readers()
         self.win = BaseWindow()
 
     def run(self):